@@ -24,11 +24,21 @@ import Metashape
 
 # ---------- Added from metashape_proc_Upscale ----------
 def find_files(folder: Path, extensions: Tuple[str]) -> List[str]:
-    """Recursively find files with specified extensions."""
-    return [
-        str(p) for p in folder.rglob("*")
-        if p.suffix.lower() in extensions and p.is_file()
-    ]
+    """Recursively find files with specified extensions (os.scandir walk, symlinked directories not followed)."""
+    # Lowercase extensions without the dot, looked up in a set against the text after the last dot of each name
+    ext_set = frozenset(e.lstrip('.').lower() for e in extensions)
+    found = []
+    stack = [os.fspath(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    _, dot, ext = entry.name.rpartition('.')
+                    if dot and ext.lower() in ext_set:
+                        found.append(entry.path)
+    return found
 
 # Define Metashape project directory
 proj_directory = Path(r"M:\working_package_2\2024_dronecampaign\02_processing\metashape_projects\Upscale_Metashapeprojects")
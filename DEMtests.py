@@ -554,12 +554,12 @@ def proc_rgb():
 
         # shift coordinates in the chunk
         for camera in chunk.cameras:
-            if not camera.label == camera.master.label:
+            if camera.label != camera.master.label:
                 continue
-            if not camera.reference.location:
+            location = camera.reference.location
+            if not location:
                 continue
-            else:
-                camera.reference.location = camera.reference.location + P1_shift
+            camera.reference.location = location + P1_shift
 
 
     # Log the reference CRS before reloading
@@ -909,16 +909,18 @@ def proc_multispec(rgb_dem_files):
     # chunk.crs = target_crs
     # doc.save()
     
-    del_camera_names = list()
+    del_camera_names = set()
 
     # Only look at altitude of master band images
     for camera in chunk.cameras:
-        if not camera.label == camera.master.label:
+        label = camera.label
+        if label != camera.master.label:
             continue
-        if not camera.reference.location:
+        location = camera.reference.location
+        if not location:
             continue
-        if camera.reference.location.z == 0:
-            del_camera_names.append(camera.label)
+        if location.z == 0:
+            del_camera_names.add(label)
 
     # Delete images outside of P1 capture times
     # Identify cameras to delete (outside P1 capture times)
@@ -1082,17 +1084,16 @@ def write_arguments_to_csv():
     # Collect argument values
     row = [proj_file] + [str(getattr(args, arg)) for arg in vars(args).keys()]
 
-    # Check if the row already exists in the CSV file
-    if os.path.exists(csv_file):
-        with open(csv_file, mode='r', newline='') as file:
-            reader = csv.reader(file)
-            for existing_row in reader:
-                if existing_row == row:
-                    print("Row already exists in the CSV file. Skipping writing.")
-                    return
-
-    # Write the row to the CSV file
-    with open(csv_file, mode='a', newline='') as file:
+    # Open the CSV file once: scan it for the row from the start, then append (a+ always writes at the end)
+    with open(csv_file, mode='a+', newline='') as file:
+        file.seek(0)
+        # Check if the row already exists in the CSV file
+        for existing_row in csv.reader(file):
+            if existing_row == row:
+                print("Row already exists in the CSV file. Skipping writing.")
+                return
+
+        # Write the row to the CSV file
         writer = csv.writer(file)
         if file.tell() == 0:
             writer.writerow(headers)  # Write headers if file is empty
@@ -1317,9 +1318,7 @@ MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Dual']
 
 # Used to find chunks in proc_*
 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
+dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
 
 try:
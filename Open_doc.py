@@ -71,9 +71,7 @@ def load_images(doc, rgb, multispec, CHUNK_RGB, CHUNK_MULTISPEC):
 def check_chunks(doc, CHUNK_RGB, CHUNK_MULTISPEC):
             # Used to find chunks in proc_*
         check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-        dict_chunks = {}
-        for get_chunk in doc.chunks:
-            dict_chunks.update({get_chunk.label: get_chunk.key})
+        dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
         chunk = doc.findChunk(dict_chunks[CHUNK_RGB])
         if not chunk:
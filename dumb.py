@@ -17,9 +17,7 @@ doc.open(proj_file, read_only=False)
 CHUNK_RGB = "rgb"
 CHUNK_MULTISPEC = "multispec"
 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
+dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 chunk = doc.findChunk(dict_chunks[CHUNK_RGB])
 print(compression)
 chunk.exportRaster(path=str(dem_file), source_data=Metashape.ElevationData, image_format=Metashape.ImageFormatTIFF, image_compression=compression)
\ No newline at end of file
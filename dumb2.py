@@ -2,7 +2,9 @@ import numpy as np
 import Metashape
 import upd_micasense_pos_copy as upd_micasense_pos
 import os
+import re
 import glob
+import logging
 import numpy as np
 import exifread
 import datetime
@@ -23,6 +25,10 @@ GPSUTC_deltat = 0
 MICA_deltat = 0
 EPSG_4326 = 4326
 
+logger = logging.getLogger(__name__)
+
+# Whitespace-separated MRK fields 0 (timestamp), 7 (lat), 9 (lon) and 11 (alt)
+_MRK_RE = re.compile(r'\s*(\S+)(?:\s+\S+){6}\s+(\S+)\s+\S+\s+(\S+)\s+\S+\s+(\S+)')
 
 
 P1_shift_vec = np.array([0.0, 0.0, 0.0])
@@ -31,7 +37,7 @@ MRK_PATH = r"M:\\working_package_2\\2024_dronecampaign\\01_data\\dronetest\\P1Da
 MICASENSE_PATH = r"M:\\working_package_2\\2024_dronecampaign\\01_data\\dronetest\\MicasenseData\\fullset"
 MICASENSE_CAM_CSV = "interpolated_micasense_pos.csv"
 
-def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_file, P1_shift_vec):
+def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_file, P1_shift_vec, verbose=False):
     """
     Parameters
     ----------
@@ -47,6 +53,8 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
         Path and name of output CSV file with udpated Easting/Norhting/Altitude for all MicaSense images
     P1_shift_vec : vector
         Vector to be used to blockshift P1 positions. 
+    verbose : bool
+        If True, log scan progress and print the closest P1 timestamps for the first 20 MicaSense images.
 
     Returns
     -------
@@ -143,9 +151,9 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
         E, N = transformer.transform(lat_value, lon_value)
         mica_pos.append([E, N, alt_value])
         
-        # Just a print to show progress
-        if mica_count % 100 == 0:
-            print(mica_count)
+        # Progress is only logged in verbose mode to keep stdout out of the loop
+        if verbose and mica_count % 100 == 0:
+            logger.debug("progress %d", mica_count)
         mica_count = mica_count + 1
         f.close()
     
@@ -177,21 +185,37 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
     
     P1_pos_shifted = P1_pos_arr + P1_shift_vec         
     
-    # Convert to target projected CRS prior to interpolating position
-    E, N = transformer.transform(P1_pos_shifted[:,0], P1_pos_shifted[:,1])
-    P1_pos = np.dstack((E, N, P1_pos_shifted[:,2]))[0]    
+    # Convert to target projected CRS prior to interpolating position.
+    # Contiguous float64 columns let pyproj transform in place without copying, and filling
+    # a preallocated array avoids the temporaries created by np.dstack.
+    E = np.ascontiguousarray(P1_pos_shifted[:,0], dtype=np.float64)
+    N = np.ascontiguousarray(P1_pos_shifted[:,1], dtype=np.float64)
+    transformer.transform(E, N, radians=False, inplace=True)
+    P1_pos = np.empty((P1_pos_shifted.shape[0], 3), dtype=np.float64)
+    P1_pos[:,0] = E
+    P1_pos[:,1] = N
+    P1_pos[:,2] = P1_pos_shifted[:,2]
         
-    # Create output MicaSense position csv 
-    out_frame = open(out_file, 'w')
-    # write header row
-    rec = ("Label, Easting, Northing, Ellip Height\n")
-    out_frame.write(rec) 
+    # Output rows are collected in memory and written to the CSV in one go after the loop
+    rows = [None] * len(mica_events)
     
     count = 0
     
     first_P1_timestamp = P1_first_timestamp[1]
     last_P1_timestamp = P1_last_timestamp[mrk_file_count]
 
+    # When more than one flight for same mission, flag MicaSense images that triggered between flights.
+    # Gaps run from the last P1 timestamp of one flight to the first of the next; flights are in
+    # chronological order so the gap starts are sorted and each image needs a single binary search.
+    gap_starts = np.array([P1_last_timestamp[i] for i in range(1, mrk_file_count)], dtype=np.float64)
+    gap_ends = np.array([P1_first_timestamp[i+1] for i in range(1, mrk_file_count)], dtype=np.float64)
+    mica_ts = np.array([t.timestamp() for t in mica_events], dtype=np.float64)
+    if gap_starts.size:
+        gap_idx = np.searchsorted(gap_starts, mica_ts, side='left') - 1
+        in_gap = (gap_idx >= 0) & (mica_ts < gap_ends[np.maximum(gap_idx, 0)])
+    else:
+        in_gap = np.zeros(mica_ts.shape, dtype=bool)
+
     for m_cam_time in mica_events:
         P1_triggered = True 
         a = find_nearest(P1_events, m_cam_time)
@@ -208,15 +232,12 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
             P1_triggered = False
             
         # When more than one flight for same mission, also ignore MicaSense images that triggered between flights    
-        elif(mrk_file_count > 1):
-            for mrk_loop in range(1, mrk_file_count):
-                if ((camera_time_sec > P1_last_timestamp[mrk_loop] and 
-                     camera_time_sec < P1_first_timestamp[mrk_loop+1])):
-                    time1 = 0
-                    time2 = 0
-                    upd_pos1 = [0, 0, 0]
-                    upd_pos2 = [0, 0, 0]
-                    P1_triggered = False
+        elif in_gap[count]:
+            time1 = 0
+            time2 = 0
+            upd_pos1 = [0, 0, 0]
+            upd_pos2 = [0, 0, 0]
+            P1_triggered = False
                     
         # Update MicaSense position for images that triggered within P1 times.           
         if P1_triggered:    
@@ -247,18 +268,16 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
         
         # For images captured within P1 times, write updated Easting, Northing, Ellipsoidal height to CSV
         if(upd_micasense_pos[2]!=0):
-            rec = ("%s, %10.4f, %10.4f, %10.4f\n" % \
-                    (image_name, upd_micasense_pos[0], upd_micasense_pos[1], upd_micasense_pos[2]))
+            rec = f"{image_name}, {upd_micasense_pos[0]:10.4f}, {upd_micasense_pos[1]:10.4f}, {upd_micasense_pos[2]:10.4f}\n"
         else:
             # For MicaSense images captured outisde P1 times, just save original Easting, Northing. BUT set ellipsoidal height to 0 
             # to filter and delete these cameras
-            rec = ("%s, %10.4f, %10.4f, %10.4f\n" % \
-                    (image_name, mica_pos[pos_index][0], mica_pos[pos_index][1], upd_micasense_pos[2]))
+            rec = f"{image_name}, {mica_pos[pos_index][0]:10.4f}, {mica_pos[pos_index][1]:10.4f}, {upd_micasense_pos[2]:10.4f}\n"
             
-        out_frame.write(rec) 
+        rows[count] = rec
         
         # Print the closest two P1 camera timestamps for the first 20 MicaSense cameras
-        if count < 20:
+        if verbose and count < 20:
             print(f"MicaSense Image: {image_name}")
             print(f"Closest P1 Timestamp 1: {datetime.datetime.fromtimestamp(time1)}")
             print(f"Closest P1 Timestamp 2: {datetime.datetime.fromtimestamp(time2)}")
@@ -266,8 +285,11 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
         
         count = count + 1
         
-    # Close the CSV file
-    out_frame.close()
+    # Create output MicaSense position csv with a large write buffer
+    with open(out_file, 'w', buffering=1 << 20) as out_frame:
+        # write header row
+        out_frame.write("Label, Easting, Northing, Ellip Height\n")
+        out_frame.writelines(rows)
 
 def get_P1_position(mrk_file, loop_count):
     global P1_pos_mrk, P1_events, P1_first_timestamp, P1_last_timestamp
@@ -280,16 +302,17 @@ def get_P1_position(mrk_file, loop_count):
     for line in lines:
         if line.startswith('%'):
             continue
-        parts = line.split()
-        if len(parts) < 4:
+        match = _MRK_RE.match(line)
+        if match is None:
             continue
 
         try:
             # Extract the relevant parts of the line
-            timestamp = float(parts[0])
-            lat = float(parts[7].replace(',', ''))  # Assuming latitude is at index 7
-            lon = float(parts[9].replace(',', ''))  # Assuming longitude is at index 9
-            alt = float(parts[11].replace(',', ''))  # Assuming altitude is at index 11
+            timestamp_str, lat_str, lon_str, alt_str = match.groups()
+            timestamp = float(timestamp_str)
+            lat = float(lat_str.replace(',', ''))
+            lon = float(lon_str.replace(',', ''))
+            alt = float(alt_str.replace(',', ''))
         except ValueError as e:
             print(f"Error parsing line: {line}")
             print(e)
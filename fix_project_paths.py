@@ -12,14 +12,17 @@ import argparse
 import csv
 import os
 from pathlib import Path
-from collections import defaultdict
-from typing import List, Tuple, Optional, Dict
+from collections import Counter, defaultdict
+from typing import List, Tuple, Optional, Dict, Set
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Spaces and hyphens in site names become underscores
+_SITE_TRANS = str.maketrans({' ': '_', '-': '_'})
+
 class RobustPathResolver:
     """
     A robust path resolver that can handle various naming mismatches
@@ -36,6 +39,17 @@ class RobustPathResolver:
         self.available_multispec_folders = self._get_available_folders(base_multispec_path)
         self.available_project_folders = self._get_available_folders(project_base_path)
         
+        # Index the date folders once so resolve_path does not stat per CSV row
+        self._rgb_index = self._build_date_index(base_rgb_path, self.available_rgb_folders)
+        self._multispec_index = self._build_date_index(base_multispec_path, self.available_multispec_folders)
+        
+        # (base path, available folders, date index) per path type; project paths need not exist yet
+        self._by_type = {
+            'rgb': (self.base_rgb_path, self.available_rgb_folders, self._rgb_index),
+            'multispec': (self.base_multispec_path, self.available_multispec_folders, self._multispec_index),
+            'project': (self.project_base_path, self.available_project_folders, None)
+        }
+        
         # Define comprehensive site name mappings
         self.site_mappings = self._create_comprehensive_site_mappings()
         
@@ -51,6 +65,18 @@ class RobustPathResolver:
             logger.warning(f"Could not read {base_path}: {e}")
             return []
     
+    def _build_date_index(self, base_path: Path, folders: List[str]) -> Dict[str, Set[str]]:
+        """Map each site folder to the set of date sub-folders it contains."""
+        index = {}
+        for folder in folders:
+            try:
+                with os.scandir(os.path.join(base_path, folder)) as entries:
+                    index[folder] = {e.name for e in entries if e.is_dir()}
+            except (FileNotFoundError, PermissionError) as e:
+                logger.warning(f"Could not read {base_path / folder}: {e}")
+                index[folder] = set()
+        return index
+    
     def _create_comprehensive_site_mappings(self) -> Dict[str, Dict[str, str]]:
         """
         Create comprehensive site mappings that cover all known naming variations.
@@ -193,7 +219,7 @@ class RobustPathResolver:
     
     def _normalize_site_name(self, site_name: str) -> str:
         """Normalize site name for comparison (lowercase, no spaces, etc.)"""
-        return site_name.lower().replace(' ', '_').replace('-', '_')
+        return site_name.translate(_SITE_TRANS).lower()
     
     def _find_fuzzy_match(self, target: str, available_folders: List[str]) -> Optional[str]:
         """
@@ -234,53 +260,30 @@ class RobustPathResolver:
         Returns:
             The resolved Path object or None if not found
         """
+        resolved = self._by_type.get(path_type)
+        if resolved is None:
+            return None
+        base_path, available_folders, date_index = resolved
+        
         # First try direct mapping
         if site_name in self.site_mappings:
             target_folder = self.site_mappings[site_name][path_type]
             
-            if path_type == "rgb":
-                base_path = self.base_rgb_path
-                available_folders = self.available_rgb_folders
-            elif path_type == "multispec":
-                base_path = self.base_multispec_path
-                available_folders = self.available_multispec_folders
-            elif path_type == "project":
-                base_path = self.project_base_path
-                available_folders = self.available_project_folders
-            else:
-                return None
-            
             # Check if the mapped folder exists
             if target_folder in available_folders:
-                if path_type == "project":
+                if date_index is None:
+                    return base_path / target_folder / date_str
+                elif date_str in date_index.get(target_folder, ()):
                     return base_path / target_folder / date_str
-                else:
-                    candidate_path = base_path / target_folder / date_str
-                    if candidate_path.exists():
-                        return candidate_path
         
         # If direct mapping fails, try fuzzy matching
-        if path_type == "rgb":
-            base_path = self.base_rgb_path
-            available_folders = self.available_rgb_folders
-        elif path_type == "multispec":
-            base_path = self.base_multispec_path
-            available_folders = self.available_multispec_folders
-        elif path_type == "project":
-            base_path = self.project_base_path
-            available_folders = self.available_project_folders
-        else:
-            return None
-        
         fuzzy_match = self._find_fuzzy_match(site_name, available_folders)
         if fuzzy_match:
             logger.info(f"Found fuzzy match for {site_name} ({path_type}): {fuzzy_match}")
-            if path_type == "project":
+            if date_index is None:
+                return base_path / fuzzy_match / date_str
+            elif date_str in date_index.get(fuzzy_match, ()):
                 return base_path / fuzzy_match / date_str
-            else:
-                candidate_path = base_path / fuzzy_match / date_str
-                if candidate_path.exists():
-                    return candidate_path
         
         logger.warning(f"Could not resolve {path_type} path for site '{site_name}', date '{date_str}'")
         return None
@@ -303,6 +306,7 @@ class RobustPathResolver:
         Validate paths in the input CSV and create a corrected output CSV.
         """
         results = []
+        status_counts = Counter()
         
         with open(input_csv, 'r', newline='', encoding='utf-8') as infile:
             reader = csv.DictReader(infile)
@@ -353,6 +357,7 @@ class RobustPathResolver:
                     'original_multispec': original_multispec
                 }
                 results.append(result)
+                status_counts[status] += 1
                 
                 # Log the resolution
                 if paths['rgb'] and str(paths['rgb']) != original_rgb:
@@ -370,11 +375,6 @@ class RobustPathResolver:
         logger.info(f"Results written to: {output_csv}")
         
         # Print summary
-        status_counts = {}
-        for result in results:
-            status = result['image_load_status']
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
         print("\nSummary:")
         for status, count in status_counts.items():
             print(f"  {status}: {count}")
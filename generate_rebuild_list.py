@@ -6,6 +6,15 @@ import pandas as pd
 import os
 from pathlib import Path
 
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Columns carried over from the corrected CSV into the rebuild list
+REBUILD_COLUMNS = ['date', 'site', 'rgb', 'multispec', 'sunsens', 'project_path']
+
 def generate_rebuild_list():
     """Generate CSV with only projects that need rebuilding"""
     
@@ -17,7 +26,14 @@ def generate_rebuild_list():
         print("Please run fix_project_paths.py first to generate the corrected CSV")
         return
     
-    df = pd.read_csv(corrected_csv)
+    # Only load the columns written to the rebuild list; site as category makes the filtering below
+    # compare category codes instead of strings.
+    # The pyarrow engine parses columns in parallel; fall back to the default C engine without it
+    read_kwargs = {'usecols': REBUILD_COLUMNS, 'dtype': {'site': 'category'}}
+    if PYARROW_AVAILABLE:
+        df = pd.read_csv(corrected_csv, engine='pyarrow', dtype_backend='pyarrow', **read_kwargs)
+    else:
+        df = pd.read_csv(corrected_csv, **read_kwargs)
     
     # Define problematic sites that had path corrections
     problematic_sites = {
@@ -29,11 +45,13 @@ def generate_rebuild_list():
         "Stillberg": "case sensitivity mismatch"
     }
     
-    # Filter for problematic projects
-    problematic_df = df[df['site'].isin(problematic_sites.keys())].copy()
+    # Filter for problematic projects (isin on the categorical site column only checks each category once)
+    wanted_sites = frozenset(problematic_sites)
+    problematic_df = df[df['site'].isin(wanted_sites)].copy()
+    problematic_df['site'] = problematic_df['site'].cat.remove_unused_categories()
     
-    # Add status column
-    problematic_df['rebuild_reason'] = problematic_df['site'].map(problematic_sites)
+    # Add status column (map on a categorical only maps each category once)
+    problematic_df['rebuild_reason'] = problematic_df['site'].map(problematic_sites).astype(str)
     problematic_df['status'] = 'needs_rebuild'
     
     # Save rebuild list
@@ -45,20 +63,21 @@ def generate_rebuild_list():
     print()
     
     # Summary by site
-    summary = problematic_df.groupby('site').size().sort_values(ascending=False)
-    for site, count in summary.items():
-        print(f"  • {site}: {count} projects ({problematic_sites[site]})")
+    summary = problematic_df['site'].value_counts()
+    reasons = problematic_df.drop_duplicates('site').set_index('site')['rebuild_reason'].reindex(summary.index)
+    for site, count, reason in zip(summary.index, summary.values, reasons):
+        print(f"  • {site}: {count} projects ({reason})")
     
     print(f"\n📈 Total: {len(problematic_df)} out of {len(df)} projects ({len(problematic_df)/len(df)*100:.1f}%)")
     
     # Show some examples
     print("\n🔍 Sample problematic projects:")
-    for i, row in problematic_df.head(3).iterrows():
-        print(f"  • {row['date']} - {row['site']}")
-        print(f"    RGB: {row['rgb']}")
-        print(f"    Multispec: {row['multispec']}")
-        print(f"    Project: {row['project_path']}")
-        print(f"    Issue: {row['rebuild_reason']}")
+    for row in problematic_df.head(3).itertuples(index=False):
+        print(f"  • {row.date} - {row.site}")
+        print(f"    RGB: {row.rgb}")
+        print(f"    Multispec: {row.multispec}")
+        print(f"    Project: {row.project_path}")
+        print(f"    Issue: {row.rebuild_reason}")
         print()
     
     return rebuild_csv
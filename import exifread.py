@@ -1,40 +1,54 @@
-import exifread
-import datetime
+import exiftool
+import numpy as np
 import glob
 import os
 import fnmatch
 
-def extract_timestamp(image_path):
+EXIFTOOL_PATH = "C:/Program Files/exiftool-13.01_64/exiftool.exe"
+TIMESTAMP_TAGS = ["EXIF:DateTimeOriginal", "EXIF:SubSecTime"]
+
+def _to_datetime64(image_times, image_subsec_times):
     """
-    Extract the timestamp from an image's EXIF data.
+    Combine EXIF DateTimeOriginal and SubSecTime values into timestamps, one vector operation per step.
     
     Parameters:
-    image_path (str): Path to the image file.
+    image_times (numpy.ndarray): DateTimeOriginal strings in the EXIF format YYYY:MM:DD HH:MM:SS.
+    image_subsec_times (numpy.ndarray): SubSecTime strings. The digits are the fraction of a second;
+        a negative value is subtracted from the time instead of added.
     
     Returns:
-    datetime: The extracted timestamp.
+    numpy.ndarray: The combined timestamps as datetime64[us].
+    """
+    # YYYY:MM:DD HH:MM:SS -> YYYY-MM-DD HH:MM:SS, which numpy parses directly
+    utc_times = np.char.replace(image_times, ':', '-', count=2).astype('datetime64[us]')
+    
+    subsec = image_subsec_times.astype(np.int64)
+    magnitude = np.abs(subsec)
+    fraction = magnitude / 10.0 ** np.char.str_len(magnitude.astype(str))
+    microsec = np.round(np.sign(subsec) * fraction * 1e6).astype(np.int64)
+    return utc_times + microsec.astype('timedelta64[us]')
+
+def extract_timestamps_batch(image_paths, exiftool_path=EXIFTOOL_PATH):
     """
-    with open(image_path, 'rb') as f:
-        tags = exifread.process_file(f)
-        if not tags:
+    Extract the timestamps of many images using a single exiftool process.
+    
+    Parameters:
+    image_paths (list): Paths to the image files.
+    exiftool_path (str): Path to the exiftool executable.
+    
+    Returns:
+    numpy.ndarray: The extracted timestamps as datetime64[us], in the same order as image_paths.
+    """
+    with exiftool.ExifToolHelper(executable=exiftool_path) as et:
+        metadata = et.get_tags(image_paths, TIMESTAMP_TAGS)
+    
+    for image_path, tags in zip(image_paths, metadata):
+        if "EXIF:DateTimeOriginal" not in tags:
             raise ValueError(f"No EXIF data found in {image_path}")
-        
-        image_time = str(tags.get('EXIF DateTimeOriginal'))
-        image_subsec_time = str(tags.get('EXIF SubSecTime'))
-        
-        subsec = int(image_subsec_time)
-        negative = 1.0
-        if subsec < 0:
-            negative = -1.0
-            subsec *= -1.0
-        subsec = float('0.{}'.format(int(subsec)))
-        subsec *= negative
-        millisec = subsec * 1e3
-        
-        utc_time = datetime.datetime.strptime(image_time, "%Y:%m:%d %H:%M:%S")
-        temp_timestamp = utc_time + datetime.timedelta(milliseconds=millisec)
-        
-        return temp_timestamp
+    
+    image_times = np.array([tags["EXIF:DateTimeOriginal"] for tags in metadata], dtype=str)
+    image_subsec_times = np.array([str(tags.get("EXIF:SubSecTime", 0)) for tags in metadata], dtype=str)
+    return _to_datetime64(image_times, image_subsec_times)
 
 def find_images(folder, pattern):
     """
@@ -65,7 +79,18 @@ def calculate_average_time_difference(folder1, suffix1, folder2, suffix2, subset
     subset_size (int): Number of images to consider for the subset.
     
     Returns:
-    float: The average time difference in seconds.
+    float: The average time difference in seconds (folder1 minus folder2).
     """
     pattern1 = f"*{suffix1}[0-9][0-9][0-9][0-9].jpeg"
-    pattern2 =
\ No newline at end of file
+    pattern2 = f"*{suffix2}.tif"
+    
+    images1 = sorted(find_images(folder1, pattern1))[:subset_size]
+    images2 = sorted(find_images(folder2, pattern2))[:subset_size]
+    count = min(len(images1), len(images2))
+    if count == 0:
+        raise ValueError("No matching images found in one or both folders")
+    
+    # One exiftool round-trip for both image sets
+    timestamps = extract_timestamps_batch(images1[:count] + images2[:count])
+    differences = timestamps[:count] - timestamps[count:]
+    return float(np.mean(differences / np.timedelta64(1, 's')))
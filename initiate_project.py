@@ -14,7 +14,6 @@ import Metashape
 import os
 import sys
 import exifread
-from collections import defaultdict
 from pathlib import Path
 import csv
 
@@ -28,31 +27,63 @@ CHUNK_MULTISPEC = "multispec"
 IMG_QUAL_THRESHOLD = 0.7
 DICT_SMOOTH_STRENGTH = {'low': 50, 'medium': 100, 'high': 200}
 P1_GIMBAL1_OFFSET = (0.087, 0.0, 0.0)
-offset_dict = defaultdict(dict)
-offset_dict['RedEdge-M']['Red'] = (-0.097, -0.03, -0.06)
-offset_dict['RedEdge-M']['Dual'] = (-0.097, 0.02, -0.08)
-offset_dict['RedEdge-P']['Red'] = (0, 0, 0)
-offset_dict['RedEdge-P']['Dual'] = (0, 0, 0)
+# MicaSense lever-arm offsets on gimbal 2, indexed as OFFSETS[MODEL_IDX[cam_model], GIMBAL_IDX[sensor_config]]
+MODEL_IDX = {'RedEdge-M': 0, 'RedEdge-P': 1}
+GIMBAL_IDX = {'Red': 0, 'Dual': 1}
+OFFSETS = np.array([[[-0.097, -0.03, -0.06], [-0.097, 0.02, -0.08]],
+                    [[0, 0, 0], [0, 0, 0]]], dtype=np.float64)
+IMG_EXTENSIONS = frozenset({'jpg', 'jpeg', 'tif', 'tiff'})
+CAM_MODEL_CACHE_FILE = ".cam_model"
 
 def find_files(folder, types):
+    """
+    Return paths of all files under folder whose lowercase extension (without the dot) is in the set types.
+    Directories are walked with os.scandir using an explicit stack; symlinked directories are not followed.
+    """
     photo_list = list()
-    for dir, subdir, file in os.walk(folder):
-        for filename in file:
-            if filename.lower().endswith(types):
-                photo_list.append(os.path.join(dir, filename))
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    _, dot, ext = entry.name.rpartition('.')
+                    if dot and ext.lower() in types:
+                        photo_list.append(entry.path)
     return photo_list
 
-def read_csv(file_path):
-    with open(file_path, mode='r') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            yield row
+def _cam_model_cache(micasense_path, sample_image):
+    """
+    Return the MicaSense camera model. It is read from the EXIF of sample_image once and stored in a
+    sidecar file in micasense_path, so later runs on the same folder skip the EXIF parse.
+    """
+    cache_file = Path(micasense_path) / CAM_MODEL_CACHE_FILE
+    if cache_file.is_file():
+        cam_model = cache_file.read_text().strip()
+        if cam_model in MODEL_IDX:
+            return cam_model
+        # Stale or edited sidecar with an unknown model: read the EXIF again (and rewrite it below)
+
+    with open(sample_image, 'rb') as sample_img:
+        exif_tags = exifread.process_file(sample_img)
+    cam_model = str(exif_tags.get('Image Model'))
+    if cam_model in MODEL_IDX:
+        try:
+            cache_file.write_text(cam_model)
+        except OSError:
+            # Read-only data folder: just skip caching
+            pass
+    return cam_model
 
 def parse_csv_arguments(csv_file):
-    csv_data = list(read_csv(csv_file))
-    if not csv_data:
-        sys.exit("CSV file is empty or invalid.")
-    return csv_data[0]
+    # Only the first row is used, so stop reading after it
+    with open(csv_file, mode='r', newline='') as file:
+        csv_reader = csv.DictReader(file)
+        try:
+            return next(csv_reader)
+        except StopIteration:
+            sys.exit("CSV file is empty or invalid.")
 
 def update_args_from_csv(args, csv_data):
     args.crs = csv_data['crs']
@@ -61,27 +92,12 @@ def update_args_from_csv(args, csv_data):
     args.smooth = csv_data['smooth']
     args.drtk = None  # Assuming DRTK is not provided in the CSV
 
-csv_file = 'path_to_csv_file.csv'  # Replace with the actual path to your CSV file
-csv_data = parse_csv_arguments(csv_file)
-update_args_from_csv(args, csv_data)
-
-def main():
-    print("Script start")
-
-    # Parse arguments and initialise variables
-    parser = argparse.ArgumentParser(description='Initiate Metashape project by loading images')
-    parser.add_argument('-crs', help='EPSG code for target projected CRS for micasense cameras. E.g: 7855 for GDA2020/MGA zone 55', required=True)
-    parser.add_argument('-multispec', help='path to multispectral level0_raw folder with raw images')
-    parser.add_argument('-rgb', help='path to RGB level0_raw folder that also has the MRK files')
-    parser.add_argument('-smooth', help='Smoothing strength used to smooth RGB mesh low/med/high', default="low")
-    parser.add_argument('-drtk', help='If RGB coordinates to be blockshifted, file containing DRTK base station coordinates from field and AUSPOS')
-
-    global args
-    args = parser.parse_args()
-    global MRK_PATH, MICASENSE_PATH
-
+def run(crs, multispec=None, rgb=None, smooth="low", drtk=None):
+    """
+    Load P1 and MicaSense images into the open Metashape project. Can be called once per project by a
+    driver without going through argparse.
+    """
     # Metashape project
-    global doc
     doc = Metashape.app.document
 
     if doc is None:
@@ -92,13 +108,13 @@ def main():
 
     # if Metashape project has not been saved
     if proj_file == '':
-        if args.rgb:
-            proj_file = str(Path(args.rgb).parents[0] / "metashape_project.psx")
+        if rgb:
+            proj_file = str(Path(rgb).parents[0] / "metashape_project.psx")
             print("Metashape project saved as %s" % proj_file)
             doc.save(proj_file)
 
-    if args.rgb:
-        MRK_PATH = args.rgb
+    if rgb:
+        MRK_PATH = rgb
     else:
         # Default is relative to project location: ../rgb/level0_raw/
         MRK_PATH = Path(proj_file).parents[1] / "rgb/level0_raw"
@@ -107,8 +123,8 @@ def main():
         else:
             MRK_PATH = str(MRK_PATH)
 
-    if args.multispec:
-        MICASENSE_PATH = args.multispec
+    if multispec:
+        MICASENSE_PATH = multispec
     else:
         # Default is relative to project location: ../multispec/level0_raw/
         MICASENSE_PATH = Path(proj_file).parents[1] / "multispec/level0_raw"
@@ -117,17 +133,17 @@ def main():
         else:
             MICASENSE_PATH = str(MICASENSE_PATH)
 
-    if args.drtk is not None:
-        DRTK_TXT_FILE = args.drtk
+    if drtk is not None:
+        DRTK_TXT_FILE = drtk
         if not Path(DRTK_TXT_FILE).is_file():
             sys.exit("%s file does not exist. Check and input correct path using -drtk option" % str(DRTK_TXT_FILE))
 
-    if args.smooth not in DICT_SMOOTH_STRENGTH:
+    if smooth not in DICT_SMOOTH_STRENGTH:
         sys.exit("Value for -smooth must be one of low, medium or high.")
 
     # Add images
     # rgb
-    p1_images = find_files(MRK_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
+    p1_images = find_files(MRK_PATH, IMG_EXTENSIONS)
     chunk = doc.addChunk()
     chunk.label = "rgb"
     chunk.addPhotos(p1_images, load_xmp_accuracy=True)
@@ -139,7 +155,7 @@ def main():
         sys.exit("Chunk rgb: script expects images loaded to be in CRS WGS84 EPSG::4326")
 
     # multispec
-    micasense_images = find_files(MICASENSE_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
+    micasense_images = find_files(MICASENSE_PATH, IMG_EXTENSIONS)
     chunk = doc.addChunk()
     chunk.label = "multispec"
     chunk.addPhotos(micasense_images)
@@ -153,34 +169,24 @@ def main():
 
     # Check that lever-arm offsets are non-zero:
     if P1_GIMBAL1_OFFSET == 0:
-        err_msg = "Lever-arm offset for P1 in dual gimbal mode cannot be 0. Update offset_dict and rerun_script."
+        err_msg = "Lever-arm offset for P1 in dual gimbal mode cannot be 0. Update P1_GIMBAL1_OFFSET and rerun_script."
         Metashape.app.messageBox(err_msg)
 
-    sample_img = open(micasense_images[0], 'rb')
-    exif_tags = exifread.process_file(sample_img)
-    cam_model = str(exif_tags.get('Image Model'))
+    cam_model = _cam_model_cache(MICASENSE_PATH, micasense_images[0])
 
-    if len(chunk.sensors) >= 10:
-        if offset_dict[cam_model]['Dual'] == (0, 0, 0):
-            err_msg = "Lever-arm offsets for " + cam_model + " Dual on gimbal 2 cannot be 0. Update offset_dict and rerun script."
-            Metashape.app.messageBox(err_msg)
-        else:
-            MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Dual']
+    # Dual (10-band) or Red (5-band) configuration
+    sensor_config = 'Dual' if len(chunk.sensors) >= 10 else 'Red'
+    ms_offset = OFFSETS[MODEL_IDX[cam_model], GIMBAL_IDX[sensor_config]]
+    if not ms_offset.any():
+        err_msg = "Lever-arm offsets for " + cam_model + " " + sensor_config + " on gimbal 2 cannot be 0. Update OFFSETS and rerun script."
+        Metashape.app.messageBox(err_msg)
     else:
-        if offset_dict[cam_model]['Red'] == (0, 0, 0):
-            err_msg = "Lever-arm offsets for " + cam_model + " Red on gimbal 2 cannot be 0. Update offset_dict and rerun script."
-            Metashape.app.messageBox(err_msg)
-        else:
-            MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Red']
+        MS_GIMBAL2_OFFSET = tuple(ms_offset)
 
-    check_chunk_list = ["rgb", "multispec"]
-    dict_chunks = {}
-    for get_chunk in doc.chunks:
-        dict_chunks.update({get_chunk.label: get_chunk.key})
+    dict_chunks = {get_chunk.label: get_chunk for get_chunk in doc.chunks}
 
     if 'Chunk 1' in dict_chunks:
-        chunk = doc.findChunk(dict_chunks['Chunk 1'])
-        doc.remove(chunk)
+        doc.remove(dict_chunks['Chunk 1'])
         doc.save()
 
     doc.save()
@@ -199,5 +205,25 @@ def main():
     print("###########################")
     print("###########################")
 
+def main():
+    print("Script start")
+
+    # Parse arguments and initialise variables
+    parser = argparse.ArgumentParser(description='Initiate Metashape project by loading images')
+    parser.add_argument('-crs', help='EPSG code for target projected CRS for micasense cameras. E.g: 7855 for GDA2020/MGA zone 55')
+    parser.add_argument('-multispec', help='path to multispectral level0_raw folder with raw images')
+    parser.add_argument('-rgb', help='path to RGB level0_raw folder that also has the MRK files')
+    parser.add_argument('-smooth', help='Smoothing strength used to smooth RGB mesh low/med/high', default="low")
+    parser.add_argument('-drtk', help='If RGB coordinates to be blockshifted, file containing DRTK base station coordinates from field and AUSPOS')
+    parser.add_argument('-csv', help='CSV file whose first row provides crs, multispec, rgb and smooth')
+    args = parser.parse_args()
+
+    if args.csv:
+        update_args_from_csv(args, parse_csv_arguments(args.csv))
+    if not args.crs:
+        parser.error("-crs is required (directly or via -csv)")
+
+    run(args.crs, args.multispec, args.rgb, args.smooth, args.drtk)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
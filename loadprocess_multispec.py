@@ -1,21 +1,14 @@
-from collections import defaultdict
-from upd_micasense_pos_original import ret_micasense_pos
+from functools import lru_cache
 from pathlib import Path
 import argparse
-import math
 import collections
+import importlib
+import os
 import numpy as np
 import Metashape
-import os
-import sys
-import exifread
-from collections import defaultdict
-from upd_micasense_pos_original import ret_micasense_pos
-import importlib
 import upd_micasense_pos_original
-
-importlib.reload(upd_micasense_pos_original)
-from pathlib import Path
+from upd_micasense_pos_original import ret_micasense_pos
+from preprocess_rebuild_projects import preprocessed_cam_csv
 
 # -*- coding: utf-8 -*-
 """
@@ -51,7 +44,10 @@ Summary:
 
 """
 
-importlib.reload(upd_micasense_pos_original)
+# Pick up edits to upd_micasense_pos_original when re-running from the Metashape console during development
+if os.environ.get('DEV_RELOAD'):
+    importlib.reload(upd_micasense_pos_original)
+    from upd_micasense_pos_original import ret_micasense_pos
 
 # Metashape Python API updates in v2.0
 METASHAPE_V2_PLUS = False
@@ -73,17 +69,71 @@ CHUNK_MULTISPEC = "multispec"
 
 IMG_QUAL_THRESHOLD = 0.7
 
+MRK_PATH = r"M:\working_package_2\2024_dronecampaign\01_data\dronetest\P1Data\DJI_202408080937_002_p1micasense60mtest"
+
+IMG_EXTENSIONS = frozenset({'jpg', 'jpeg', 'tif', 'tiff'})
+CAM_MODEL_CACHE_FILE = ".cam_model"
+
+# Index of the NIR band used as primary channel. Micasense Dual: NIR is sensors[9], and in RedEdge-M sensors[4]
+PRIMARY_CHANNEL = {'RedEdge-M': 4, 'RedEdge-P': 9}
+
+# Raster transform formula per camera model to export relative reflectance (5 bands for RedEdge-M, 10 for Dual)
+RASTER_FORMULA = {'RedEdge-M': tuple(f"B{i}/32768" for i in range(1, 6)),
+                  'RedEdge-P': tuple(f"B{i}/32768" for i in range(1, 11))}
+
 ###############################################################################
 # Function definitions
 ###############################################################################
 def find_files(folder, types):
+    """
+    Return paths of all files under folder whose lowercase extension (without the dot) is in the set types.
+    Directories are walked with os.scandir using an explicit stack; symlinked directories are not followed.
+    """
     photo_list = list()
-    for dir, subdir, file in os.walk(folder):
-        for filename in file:
-            if filename.lower().endswith(types):
-                photo_list.append(os.path.join(dir, filename))
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    _, dot, ext = entry.name.rpartition('.')
+                    if dot and ext.lower() in types:
+                        photo_list.append(entry.path)
     return photo_list
 
+@lru_cache(maxsize=16)
+def _crs(code):
+    """
+    Return the Metashape CoordinateSystem for an EPSG code, built once per code for repeated runs in one session.
+    """
+    return Metashape.CoordinateSystem(f"EPSG::{code}")
+
+def _cam_model_cache(micasense_path, sample_image):
+    """
+    Return the MicaSense camera model. It is read from the EXIF of sample_image once and stored in a
+    sidecar file in micasense_path, so later runs on the same folder skip the EXIF parse.
+    """
+    cache_file = Path(micasense_path) / CAM_MODEL_CACHE_FILE
+    if cache_file.is_file():
+        cam_model = cache_file.read_text().strip()
+        if cam_model in PRIMARY_CHANNEL:
+            return cam_model
+        # Stale or edited sidecar with an unknown model: read the EXIF again (and rewrite it below)
+
+    import exifread
+
+    with open(sample_image, 'rb') as sample_img:
+        exif_tags = exifread.process_file(sample_img)
+    cam_model = str(exif_tags.get('Image Model'))
+    if cam_model in PRIMARY_CHANNEL:
+        try:
+            cache_file.write_text(cam_model)
+        except OSError:
+            # Read-only data folder: just skip caching
+            pass
+    return cam_model
+
 def copyBoundingBox(from_chunk_label, to_chunk_labels):
     print("Script started...")
 
@@ -120,10 +170,13 @@ def copyBoundingBox(from_chunk_label, to_chunk_labels):
         chunk.region.center = C0
         chunk.region.size = s0
 
-def proc_multispec():
+def proc_multispec(doc, dict_chunks, cam_model, ms_gimbal2_offset, crs, smooth, sunsens, quality,
+                   mrk_path, micasense_path, micasense_cam_csv):
     """
     Author: Poornima Sivanandam
-    Arguments: None
+    Arguments: open Metashape document, chunks by label, MicaSense camera model and gimbal 2 lever-arm offset,
+        processing options (crs, smooth, sunsens, matchPhotos downscale) and the MRK/MicaSense input paths and
+        csv path for the interpolated positions
     Return: None
     Create: Multispec orthomosaic in multispec/level1_proc or in Metashape project folder
     Summary:
@@ -141,9 +194,10 @@ def proc_multispec():
         * Build and export orthomosaic with raster transformed values (relative reflectance)
     """
 
-    chunk = doc.findChunk(dict_chunks[CHUNK_MULTISPEC])
+    chunk = dict_chunks[CHUNK_MULTISPEC]
+    proj_file = doc.path
 
-    target_crs = Metashape.CoordinateSystem("EPSG::" + args.crs)
+    target_crs = _crs(crs)
 
     # Get image suffix of master camera
     camera = chunk.cameras[0]
@@ -154,67 +208,57 @@ def proc_multispec():
 
     P1_shift_vec = np.array([0.0, 0.0, 0.0])
 
-    print("Interpolate Micasense position based on P1 with blockshift" + str(P1_shift_vec))
+    # Positions from preprocess_rebuild_projects.py (same interpolation, no blockshift), only if computed from
+    # this run's crs, master band suffix and MRK/MicaSense folders
+    preprocessed_csv = preprocessed_cam_csv(Path(proj_file).parent, crs, img_suffix_master, mrk_path, micasense_path)
+    if preprocessed_csv is not None:
+        print("Using preprocessed interpolated Micasense positions in " + str(preprocessed_csv))
+        micasense_cam_csv = preprocessed_csv
+    else:
+        print("Interpolate Micasense position based on P1 with blockshift" + str(P1_shift_vec))
 
-    # inputs: paths to MRK file for P1 position, Micasense image path, image suffix for master band images, target CRS
-    # returns output csv file with interpolated micasense positions
-    ret_micasense_pos(MRK_PATH, MICASENSE_PATH, img_suffix_master, args.crs,
-                      str(MICASENSE_CAM_CSV), P1_shift_vec)
+        # inputs: paths to MRK file for P1 position, Micasense image path, image suffix for master band images,
+        # target CRS. returns output csv file with interpolated micasense positions
+        ret_micasense_pos(mrk_path, micasense_path, img_suffix_master, crs,
+                          str(micasense_cam_csv), P1_shift_vec)
 
     # Load updated positions in the chunk
-    chunk.importReference(str(MICASENSE_CAM_CSV), format=Metashape.ReferenceFormatCSV, columns="nxyz",
+    chunk.importReference(str(micasense_cam_csv), format=Metashape.ReferenceFormatCSV, columns="nxyz",
                           delimiter=",", crs=target_crs, skip_rows=1,
                           items=Metashape.ReferenceItemsCameras)
-    doc.save()
 
     # ret_micasense_pos wrote Altitude = 0 (last column) for MicaSense images that triggered when P1 did not.
-    # Create a list of cameras with Altitude = 0
-    del_camera_names = list()
-
-    # Only look at altitude of master band images
-    for camera in chunk.cameras:
-        if camera.master.reference.location.z == 0:
-            del_camera_names.append(camera.master.label)
-
-    # Disable images outside of P1 capture times
+    # Disable images outside of P1 capture times, only looking at altitude of master band images
     print("Disabling MicaSense images that triggered outside P1 capture times")
-    for camera in chunk.cameras:
-        if camera.label in del_camera_names:
-            camera.enabled = False
+    # Each master is shared by all bands of a capture, so check every master only once
+    masters = {master.key: master for master in (camera.master for camera in chunk.cameras)}
+    for master in masters.values():
+        location = master.reference.location
+        if location is not None and location.z == 0:
+            master.enabled = False
 
     # save project
     doc.save()
 
     # Set primary channel
     #
-    # Get index of NIR band. Micasense Dual: NIR is sensors[9], and in RedEdge-M sensors[4]
-    if cam_model == 'RedEdge-M':
-        primary_channel = 4
-    elif cam_model == 'RedEdge-P':
-        primary_channel = 9
+    # Get index of NIR band
+    primary_channel = PRIMARY_CHANNEL[cam_model]
     for s in chunk.sensors:
         s.index = primary_channel
 
     # GPS/INS offset for master sensor
     #
     print("Updating Micasense GPS offset")
-    chunk.sensors[0].antenna.location_ref = Metashape.Vector(MS_GIMBAL2_OFFSET)
+    chunk.sensors[0].antenna.location_ref = Metashape.Vector(ms_gimbal2_offset)
 
     #
     # Set Raster Transform to calculate reflectance
     #
     print("Updating Raster Transform for relative reflectance")
-    raster_transform_formula = []
-    num_bands = len(chunk.sensors)
-    if cam_model == 'RedEdge-M':
-        raster_transform_formula = ["B1/32768", "B2/32768", "B3/32768", "B4/32768", "B5/32768"]
-    elif cam_model == 'RedEdge-P':
-        raster_transform_formula = ["B1/32768", "B2/32768", "B3/32768", "B4/32768", "B5/32768", "B6/32768", "B7/32768", "B8/32768", "B9/32768", "B10/32768"]
-
-    chunk.raster_transform.formula = raster_transform_formula
+    chunk.raster_transform.formula = list(RASTER_FORMULA[cam_model])
     chunk.raster_transform.calibrateRange()
     chunk.raster_transform.enabled = True
-    doc.save()
 
     #
     # Estimate image quality and remove cameras with quality < threshold
@@ -228,12 +272,12 @@ def proc_multispec():
     if low_img_qual:
         for camera in low_img_qual:
             camera.enabled = False
-    doc.save()
     #
     #
     # Calibrate Reflectance
     #
-    chunk.calibrateReflectance(use_reflectance_panels=True, use_sun_sensor= args.sunsens)
+    chunk.calibrateReflectance(use_reflectance_panels=True, use_sun_sensor=sunsens)
+    doc.save()
 
     #
     # Align Photos
@@ -244,12 +288,10 @@ def proc_multispec():
     # Downscale values per https://www.agisoft.com/forum/index.php?topic=11697.0
     # Downscale: highest, high, medium, low, lowest: 0, 1, 2, 4, 8 # to be set below
     # Quality:  High, Reference Preselection: Source
-    chunk.matchPhotos(downscale= quality3 , generic_preselection=False, reference_preselection=True,
+    chunk.matchPhotos(downscale=quality, generic_preselection=False, reference_preselection=True,
                       reference_preselection_mode=Metashape.ReferencePreselectionSource)
-    doc.save()
     print("Aligning cameras")
     chunk.alignCameras()
-    doc.save()
 
     # Gradual selection based on reprojection error
     print("Gradual selection for reprojection error...")
@@ -257,7 +299,6 @@ def proc_multispec():
     threshold = 0.5
     f.init(chunk, criterion=Metashape.TiePoints.Filter.ReprojectionError)
     f.removePoints(threshold)
-    doc.save()
 
     #
     # Optimise Cameras
@@ -274,13 +315,12 @@ def proc_multispec():
     # Build and export orthomosaic
     #
     # Import P1 model for use in orthorectification
-    smooth_val = DICT_SMOOTH_STRENGTH[args.smooth]
+    smooth_val = DICT_SMOOTH_STRENGTH[smooth]
     model_file = Path(proj_file).parent / (Path(proj_file).stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
     chunk.importModel(path=str(model_file), crs=target_crs, format=Metashape.ModelFormatOBJ)
 
     print("Build orthomosaic")
     chunk.buildOrthomosaic(surface_data=Metashape.DataSource.ModelData, refine_seamlines=True)
-    doc.save()
 
     if chunk.orthomosaic:
         orthomosaic_path = Path(proj_file).parent / (Path(proj_file).stem + "_multispec_orthomosaic.tif")
@@ -288,7 +328,7 @@ def proc_multispec():
         print(f"Orthomosaic exported to {orthomosaic_path}")
 
     # Export the processing report
-    report_path = dir_path / (
+    report_path = Path(proj_file).parent / (
                 Path(proj_file).stem + "_multispec_report.pdf")
     print(f"Exporting processing report to {report_path}...")
     chunk.exportReport(path = str(report_path))
@@ -297,97 +337,97 @@ def proc_multispec():
     print("Multispec chunk processing complete!")
 
 
+def run(crs, multispec=None, smooth="low", sunsens=False, test=False, mrk_path=MRK_PATH):
+    """
+    Add the MicaSense images to the open Metashape project and process the multispec chunk. Can be called once
+    per project by a driver without going through argparse.
+    """
+    # Metashape project
+    doc = Metashape.app.document
+    proj_file = doc.path
+
+    # if Metashape project has not been saved
+    if proj_file == '':
+        raise Exception("Metashape project has not been saved. Please save the project and try again.")
+
+    if multispec:
+        micasense_path = multispec
+    else:
+        # Default is relative to project location: ../multispec/level0_raw/
+        micasense_path = str(Path(proj_file).parent / "../multispec/level0_raw/")
+
+    if smooth not in DICT_SMOOTH_STRENGTH:
+        raise Exception("Invalid smoothing strength. Choose from 'low', 'medium', or 'high'.")
+
+    # Set quality values for the downscale value in Multispec for testing
+    if test:
+        quality = 4  # low quality for testing
+    else:
+        quality = 1  # high quality for production
+
+    # By default save the CSV with updated MicaSense positions in the MicaSense folder. CSV used within script.
+    micasense_cam_csv = Path(proj_file).parent / "interpolated_micasense_pos.csv"
+
+    ##################
+    # Add images
+    ##################
+    #
+    # multispec
+    micasense_images = find_files(micasense_path, IMG_EXTENSIONS)
+
+    chunk = doc.addChunk()
+    chunk.label = CHUNK_MULTISPEC
+    chunk.addPhotos(micasense_images)
+    doc.save()
+
+    # Check that chunk is not empty and images are in default WGS84 CRS
+    if len(chunk.cameras) == 0:
+        raise Exception("No images found in the multispec folder.")
+    if "EPSG::4326" not in str(chunk.crs):
+        raise Exception("Chunk coordinate system is not EPSG::4326.")
+
+    # MicaSense: get Camera Model from one of the images to check the lever-arm offsets for the relevant model
+    cam_model = _cam_model_cache(micasense_path, micasense_images[0])
+
+    # HARDCODED number of bands.
+    if len(chunk.sensors) >= 10:
+        ms_gimbal2_offset = (0.0, 0.0, 0.0)  # Update with actual offset values
+    else:
+        raise Exception("Unexpected number of sensors in the multispec chunk.")
+
+    # Used to find chunks in proc_*
+    dict_chunks = {get_chunk.label: get_chunk for get_chunk in doc.chunks}
+
+    # Delete 'Chunk 1' that is created by default.
+    if 'Chunk 1' in dict_chunks:
+        doc.remove(dict_chunks['Chunk 1'])
+
+    # Process multispec chunk
+    proc_multispec(doc, dict_chunks, cam_model, ms_gimbal2_offset, crs, smooth, sunsens, quality,
+                   mrk_path, micasense_path, micasense_cam_csv)
+
+
 ############################################
 ##  Main code
 ############################################
-print("Script start")
-
-# Parse arguments and initialise variables
-parser = argparse.ArgumentParser(
-    description='Update camera positions in MicaSense chunks in Metashape project')
-parser.add_argument('-crs',
-                    help='EPSG code for target projected CRS for micasense cameras. E.g: 7855 for GDA2020/MGA zone 55',
-                    required=True)
-parser.add_argument('-multispec', help='path to multispectral level0_raw folder with raw images')
-parser.add_argument('-smooth', help='Smoothing strength used to smooth RGB mesh low/med/high', default="low")
-parser.add_argument('-sunsens', help='boolean to use sun sensor data for reflectance calibration', default=False)
-parser.add_argument('-test', help='boolean to make processing faster for debugging', default=False)
-
-global args
-args = parser.parse_args()
-global MRK_PATH, MICASENSE_PATH
-
-
-
-# Metashape project
-global doc
-doc = Metashape.app.document
-proj_file = doc.path
-
-MRK_PATH = "M:\working_package_2\2024_dronecampaign\01_data\dronetest\P1Data\DJI_202408080937_002_p1micasense60mtest"
-
-# if Metashape project has not been saved
-if proj_file == '':
-    raise Exception("Metashape project has not been saved. Please save the project and try again.")
-
-if args.multispec:
-    MICASENSE_PATH = args.multispec
-else:
-    # Default is relative to project location: ../multispec/level0_raw/
-    MICASENSE_PATH = str(Path(proj_file).parent / "../multispec/level0_raw/")
-
-if args.smooth not in DICT_SMOOTH_STRENGTH:
-    raise Exception("Invalid smoothing strength. Choose from 'low', 'medium', or 'high'.")
-
-# Set quality values for the downscale value in Multispec for testing
-if args.test:
-    quality3 = 4  # low quality for testing
-else:
-    quality3 = 1  # high quality for production
-
-# By default save the CSV with updated MicaSense positions in the MicaSense folder. CSV used within script.
-MICASENSE_CAM_CSV = Path(proj_file).parent / "interpolated_micasense_pos.csv"
-
-##################
-# Add images
-##################
-#
-# multispec
-micasense_images = find_files(MICASENSE_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
-
-chunk = doc.addChunk()
-chunk.label = CHUNK_MULTISPEC
-chunk.addPhotos(micasense_images)
-doc.save()
-
-# Check that chunk is not empty and images are in default WGS84 CRS
-if len(chunk.cameras) == 0:
-    raise Exception("No images found in the multispec folder.")
-if "EPSG::4326" not in str(chunk.crs):
-    raise Exception("Chunk coordinate system is not EPSG::4326.")
-
-# MicaSense: get Camera Model from one of the images to check the lever-arm offsets for the relevant model
-sample_img = open(micasense_images[0], 'rb')
-exif_tags = exifread.process_file(sample_img)
-cam_model = str(exif_tags.get('Image Model'))
-
-# HARDCODED number of bands.
-if len(chunk.sensors) >= 10:
-    MS_GIMBAL2_OFFSET = (0.0, 0.0, 0.0)  # Update with actual offset values
-else:
-    raise Exception("Unexpected number of sensors in the multispec chunk.")
-
-# Used to find chunks in proc_*
-check_chunk_list = [CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    if get_chunk.label in check_chunk_list:
-        dict_chunks[get_chunk.label] = get_chunk
-
-# Delete 'Chunk 1' that is created by default.
-if 'Chunk 1' in dict_chunks:
-    doc.remove(dict_chunks['Chunk 1'])
-
-# Process multispec chunk
-proc_multispec()
-print("End of script")
\ No newline at end of file
+def main():
+    print("Script start")
+
+    # Parse arguments and initialise variables
+    parser = argparse.ArgumentParser(
+        description='Update camera positions in MicaSense chunks in Metashape project')
+    parser.add_argument('-crs',
+                        help='EPSG code for target projected CRS for micasense cameras. E.g: 7855 for GDA2020/MGA zone 55',
+                        required=True)
+    parser.add_argument('-multispec', help='path to multispectral level0_raw folder with raw images')
+    parser.add_argument('-smooth', help='Smoothing strength used to smooth RGB mesh low/med/high', default="low")
+    parser.add_argument('-sunsens', help='boolean to use sun sensor data for reflectance calibration', default=False)
+    parser.add_argument('-test', help='boolean to make processing faster for debugging', default=False)
+    args = parser.parse_args()
+
+    run(args.crs, args.multispec, args.smooth, args.sunsens, args.test)
+    print("End of script")
+
+
+if __name__ == "__main__":
+    main()
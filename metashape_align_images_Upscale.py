@@ -1,11 +1,54 @@
 import argparse
+import hashlib
+import io
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import exifread
 import Metashape
-from metashape_proc_Upscale import find_files, CHUNK_RGB, CHUNK_MULTISPEC, DICT_SMOOTH_STRENGTH, P1_GIMBAL1_OFFSET, offset_dict
+from metashape_proc_Upscale import find_files, IMG_EXTENSIONS, CHUNK_RGB, CHUNK_MULTISPEC, DICT_SMOOTH_STRENGTH, P1_GIMBAL1_OFFSET, offset_dict
+
+EXIF_PREFIX_BYTES = 64 * 1024
+FIND_FILES_CACHE_DIR = ".find_files_cache"
+
+def _is_wgs84(crs):
+    """
+    True if crs is EPSG::4326. Uses the authority code directly and only formats the whole CRS when no
+    authority is set.
+    """
+    if crs is None:
+        return False
+    if crs.authority:
+        return crs.authority == "EPSG::4326"
+    return "EPSG::4326" in str(crs)
+
+def _cached_find_files(root, types, cache_dir):
+    """
+    find_files with the result stored as newline-separated paths in cache_dir. The cache key includes the
+    modification time of root, so adding or removing entries directly in root invalidates it. Raw flight
+    folders are not modified after download, so changes deeper in the tree are not checked.
+    """
+    root = os.fspath(root)
+    key = f"{os.path.abspath(root)}|{os.stat(root).st_mtime_ns}|{'|'.join(sorted(types))}"
+    cache_file = Path(cache_dir) / (hashlib.sha1(key.encode('utf-8')).hexdigest() + ".txt")
+    if cache_file.is_file():
+        return cache_file.read_text(encoding='utf-8').splitlines()
+
+    files = find_files(root, types)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text("\n".join(files), encoding='utf-8')
+    except OSError:
+        # Cache folder not writable: just skip caching
+        pass
+    return files
 
 def load_images():
+    """
+    Parse the command line, add the P1 and MicaSense images to new chunks in the open project and save it.
+    Returns (args, doc, MRK_PATH, MICASENSE_PATH) for use by the caller.
+    """
     print("Script start")
 
     # Parse arguments and initialise variables
@@ -22,12 +65,9 @@ def load_images():
     
     
 
-    global args
     args = parser.parse_args()
-    global MRK_PATH, MICASENSE_PATH
 
     # Metashape project
-    global doc
     doc = Metashape.app.document
     proj_file = doc.path
 
@@ -46,27 +86,26 @@ def load_images():
         print("Metashape project saved as %s" % proj_file)
         doc.save(str(proj_file))  # Convert WindowsPath to string
 
+    proj_path = Path(proj_file)
+    proj_parent = proj_path.parent
+    proj_root = proj_path.parents[1]
+
     if args.rgb:
         MRK_PATH = args.rgb
     else:
         # Default is relative to project location: ../rgb/level0_raw/
-        MRK_PATH = Path(proj_file).parents[1] / "rgb/level0_raw"
-        if not MRK_PATH.is_dir():
-            sys.exit("%s directory does not exist. Check and input paths using -rgb " % str(MRK_PATH))
-        else:
-            MRK_PATH = str(MRK_PATH)
+        MRK_PATH = os.fspath(proj_root / "rgb/level0_raw")
+        if not os.path.isdir(MRK_PATH):
+            sys.exit("%s directory does not exist. Check and input paths using -rgb " % MRK_PATH)
 
     # TODO update when other sensors are used
     if args.multispec:
         MICASENSE_PATH = args.multispec
     else:
         # Default is relative to project location: ../multispec/level0_raw/
-        MICASENSE_PATH = Path(proj_file).parents[1] / "multispec/level0_raw"
-
-        if not MICASENSE_PATH.is_dir():
-            sys.exit("%s directory does not exist. Check and input paths using -multispec " % str(MICASENSE_PATH))
-        else:
-            MICASENSE_PATH = str(MICASENSE_PATH)
+        MICASENSE_PATH = os.fspath(proj_root / "multispec/level0_raw")
+        if not os.path.isdir(MICASENSE_PATH):
+            sys.exit("%s directory does not exist. Check and input paths using -multispec " % MICASENSE_PATH)
 
     if args.drtk is not None:
         DRTK_TXT_FILE = args.drtk
@@ -77,16 +116,29 @@ def load_images():
         sys.exit("Value for -smooth must be one of low, medium or high.")
 
     # Export blockshifted P1 positions. Not used in script. Useful for debug or to restart parts of script following any issues.
-    P1_CAM_CSV = Path(proj_file).parent / "dbg_shifted_p1_pos.csv"
+    P1_CAM_CSV = proj_parent / "dbg_shifted_p1_pos.csv"
     # By default save the CSV with updated MicaSense positions in the MicaSense folder. CSV used within script.
-    MICASENSE_CAM_CSV = Path(proj_file).parent / "interpolated_micasense_pos.csv"
+    MICASENSE_CAM_CSV = proj_parent / "interpolated_micasense_pos.csv"
 
     ##################
     # Add images
     ##################
     #
+    # Both folders are usually on the same network share, so list them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cache_dir = proj_directory / FIND_FILES_CACHE_DIR
+        p1_future = executor.submit(_cached_find_files, MRK_PATH, IMG_EXTENSIONS, cache_dir)
+        micasense_future = executor.submit(_cached_find_files, MICASENSE_PATH, IMG_EXTENSIONS, cache_dir)
+        p1_images = p1_future.result()
+        micasense_images = micasense_future.result()
+
+    # Stop before creating any chunk if a folder has no images (e.g. a typo in -rgb/-multispec)
+    if not p1_images:
+        sys.exit(f"No images found under {MRK_PATH}")
+    if not micasense_images:
+        sys.exit(f"No images found under {MICASENSE_PATH}")
+
     # rgb
-    p1_images = find_files(MRK_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
     chunk = doc.addChunk()
     chunk.label = CHUNK_RGB
     chunk.addPhotos(p1_images)
@@ -96,23 +148,20 @@ def load_images():
     if len(chunk.cameras) == 0:
         sys.exit("Chunk rgb empty")
     # check chunk coordinate systems are default EPSG::4326
-    if "EPSG::4326" not in str(chunk.crs):
+    if not _is_wgs84(chunk.crs):
         sys.exit("Chunk rgb: script expects images loaded to be in CRS WGS84 EPSG::4326")
 
     #
     # multispec
     #
-    micasense_images = find_files(MICASENSE_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
-
     chunk = doc.addChunk()
     chunk.label = CHUNK_MULTISPEC
     chunk.addPhotos(micasense_images)
-    doc.save()
 
     # Check that chunk is not empty and images are in default WGS84 CRS
     if len(chunk.cameras) == 0:
         sys.exit("Multispec chunk empty")
-    if "EPSG::4326" not in str(chunk.crs):
+    if not _is_wgs84(chunk.crs):
         sys.exit("Multispec chunk: script expects images loaded to be in CRS WGS84 EPSG::4326")
 
     # Check that lever-arm offsets are non-zero:
@@ -123,8 +172,14 @@ def load_images():
         Metashape.app.messageBox(err_msg)
 
     # MicaSense: get Camera Model from one of the images to check the lever-arm offsets for the relevant model
-    sample_img = open(micasense_images[0], 'rb')
-    exif_tags = exifread.process_file(sample_img)
+    # Only the model is needed: skip MakerNotes and stop at the IFD0 Model tag. IFD0 is normally in the
+    # first few KiB, so parse a bounded prefix and only fall back to the whole file if the tag is not in it.
+    with open(micasense_images[0], 'rb') as sample_img:
+        exif_tags = exifread.process_file(io.BytesIO(sample_img.read(EXIF_PREFIX_BYTES)), details=False,
+                                          stop_tag='Model', debug=False)
+        if 'Image Model' not in exif_tags:
+            sample_img.seek(0)
+            exif_tags = exifread.process_file(sample_img, details=False, stop_tag='Model', debug=False)
     cam_model = str(exif_tags.get('Image Model'))
 
     # HARDCODED number of bands.
@@ -141,17 +196,11 @@ def load_images():
         else:
             MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Red']
 
-    # Used to find chunks in proc_*
-    check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-    dict_chunks = {}
-    for get_chunk in doc.chunks:
-        dict_chunks.update({get_chunk.label: get_chunk.key})
-
     # Delete 'Chunk 1' that is created by default.
-    if 'Chunk 1' in dict_chunks:
-        chunk = doc.findChunk(dict_chunks['Chunk 1'])
-        doc.remove(chunk)
-        doc.save()
+    for get_chunk in doc.chunks:
+        if get_chunk.label == 'Chunk 1':
+            doc.remove(get_chunk)
+            break
 
     doc.save()
     print("Add images completed.")
@@ -173,5 +222,7 @@ def load_images():
     print("###########################")
     print("###########################")
 
+    return args, doc, MRK_PATH, MICASENSE_PATH
+
 if __name__ == "__main__":
-    load_images()
\ No newline at end of file
+    args, doc, MRK_PATH, MICASENSE_PATH = load_images()
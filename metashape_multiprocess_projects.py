@@ -174,12 +174,21 @@ def cartesian_to_geog(X, Y, Z):
 
 
 def find_files(folder, types):
+    """
+    Return paths of all files under folder ending in one of types (lowercase tuple, case-insensitive match).
+    Directories are walked with os.scandir using an explicit stack, so DirEntry paths and cached file types are
+    used instead of os.path.join and extra stat calls; symlinked directories are not followed.
+    """
     photo_list = list()
-    for dir, subdir, file in os.walk(folder):
-        for filename in file:
-            if (filename.lower().endswith(types)):
-                photo_list.append(os.path.join(dir, filename))
-    return (photo_list)
+    stack = [os.fspath(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(types):
+                    photo_list.append(entry.path)
+    return photo_list
 
 def copyBoundingBox(from_chunk_label, to_chunk_labels):
     print("Script started...")
@@ -540,26 +549,31 @@ def proc_multispec(args,dict_chunks):
 
     # ret_micasense_pos wrote Altitude = 0 (last column) for MicaSense images that triggered when P1 did not.
     # Create a list of cameras with Altitude = 0
-    del_camera_names = list()
+    del_camera_names = set()
 
     # Only look at altitude of master band images
     for camera in chunk.cameras:
-        if not camera.label == camera.master.label:
+        label = camera.label
+        if label != camera.master.label:
             continue
-        if not camera.reference.location:
+        location = camera.reference.location
+        if not location:
             continue
-        if camera.reference.location.z == 0:
-            del_camera_names.append(camera.label)
+        if location.z == 0:
+            del_camera_names.add(label)
 
     # Delete images outside of P1 capture times
     print("Deleting MicaSense images that triggered outside P1 capture times")
+    to_remove = []
     for camera in chunk.cameras:
         # Only calibration images are in a group. The following line is necessary to avoid NoneType error on other images
         if camera.group is not None:
             if camera.group.label == 'Calibration images':
                 continue
         if camera.label in del_camera_names:
-            chunk.remove(camera)
+            to_remove.append(camera)
+    if to_remove:
+        chunk.remove(to_remove)
 
     # Disable images outside of P1 capture times
     # print("Disabling MicaSense images that triggered outside P1 capture times")
@@ -737,30 +751,36 @@ def proc_multispec(args,dict_chunks):
     print("Multispec chunk processing complete!")
 
 
+# Rows already present in each arguments CSV, filled on the first call so the file is scanned only once
+_seen_csv_rows = {}
+
+
 # Write arguments to CSV file
 def write_arguments_to_csv(args, proj_file):
     global BASE_DIR
     csv_file = os.path.join(BASE_DIR, "arguments_log.csv")
-    headers = ["proj_path"] + [arg for arg in vars(args).keys()]
+    arg_names = tuple(vars(args))
 
     # Collect argument values
-    row = [proj_file] + [str(getattr(args, arg)) for arg in vars(args).keys()]
-
-    # Check if the row already exists in the CSV file
-    if os.path.exists(csv_file):
-        with open(csv_file, mode='r', newline='') as file:
-            reader = csv.reader(file)
-            for existing_row in reader:
-                if existing_row == row:
-                    print("Row already exists in the CSV file. Skipping writing.")
-                    return
-
-    # Write the row to the CSV file
-    with open(csv_file, mode='a', newline='') as file:
+    row = (proj_file, *(str(getattr(args, arg)) for arg in arg_names))
+
+    with open(csv_file, mode='a+', newline='') as file:
+        seen = _seen_csv_rows.get(csv_file)
+        if seen is None:
+            file.seek(0)
+            seen = _seen_csv_rows[csv_file] = {tuple(existing_row) for existing_row in csv.reader(file)}
+
+        # Check if the row already exists in the CSV file
+        if row in seen:
+            print("Row already exists in the CSV file. Skipping writing.")
+            return
+
+        # Write the row to the CSV file; appends go to the end regardless of the read position
         writer = csv.writer(file)
-        if file.tell() == 0:
-            writer.writerow(headers)  # Write headers if file is empty
+        if file.seek(0, os.SEEK_END) == 0:
+            writer.writerow(("proj_path",) + arg_names)  # Write headers if file is empty
         writer.writerow(row)
+        seen.add(row)
         print("Arguments written to CSV file.")
 
 # Resume processing
@@ -917,9 +937,7 @@ if not args.multionly:
 else:
     # Used to find chunks in proc_*
     check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-    dict_chunks = {}
-    for get_chunk in doc.chunks:
-        dict_chunks.update({get_chunk.label: get_chunk.key})
+    dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
     chunk = doc.findChunk(dict_chunks[CHUNK_RGB])
     if not chunk:
@@ -962,9 +980,7 @@ else:
 
 # Used to find chunks in proc_*
 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
+dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
 # Delete 'Chunk 1' that is created by default.
 if 'Chunk 1' in dict_chunks:
@@ -1173,9 +1189,7 @@ def main():
                     
                     # Used to find chunks in proc_*
                     check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-                    dict_chunks = {}
-                    for get_chunk in doc.chunks:
-                        dict_chunks.update({get_chunk.label: get_chunk.key})
+                    dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
                     # Delete 'Chunk 1' that is created by default.
                     if 'Chunk 1' in dict_chunks:
@@ -1190,9 +1204,7 @@ def main():
             # Process the project
             elif csv_args.phase == "process":
                 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-                dict_chunks = {}
-                for get_chunk in doc.chunks:
-                    dict_chunks.update({get_chunk.label: get_chunk.key})
+                dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
                 # Processing phase
                 resume_proc()
                 print("Processing phase completed.")
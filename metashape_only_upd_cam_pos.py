@@ -171,10 +171,7 @@ MICASENSE_CAM_CSV = Path(proj_file).parent / "interpolated_micasense_pos.csv"
 # Checks
 #####################
 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
+dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
 # Delete 'Chunk 1' that is created by default.
 if 'Chunk 1' in dict_chunks:
@@ -241,12 +238,12 @@ if blockshift_p1:
 
     # shift coordinates in the chunk
     for camera in chunk.cameras:
-        if not camera.label == camera.master.label:
+        if camera.label != camera.master.label:
             continue
-        if not camera.reference.location:
+        location = camera.reference.location
+        if not location:
             continue
-        else:
-            camera.reference.location = camera.reference.location + P1_shift
+        camera.reference.location = location + P1_shift
 
 # Convert to projected coordinate system
 for camera in chunk.cameras:
@@ -304,16 +301,18 @@ doc.save()
 
 # ret_micasense_pos wrote Altitude = 0 (last column) for MicaSense cams that triggered when P1 did not.
 # Get list of cameras with Altitude = 0
-del_camera_names = list()
+del_camera_names = set()
 
 # Only look at altitude of master band images
 for camera in chunk.cameras:
-    if not camera.label == camera.master.label:
+    label = camera.label
+    if label != camera.master.label:
         continue
-    if not camera.reference.location:
+    location = camera.reference.location
+    if not location:
         continue
-    if camera.reference.location.z == 0:
-        del_camera_names.append(camera.label)
+    if location.z == 0:
+        del_camera_names.add(label)
 
 # Delete the images but do not remove any calibration images
 print("Deleting MicaSense images that triggered outside P1 capture times")
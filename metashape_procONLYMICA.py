@@ -133,12 +133,21 @@ def cartesian_to_geog(X, Y, Z):
 
 
 def find_files(folder, types):
+    """
+    Return paths of all files under folder ending in one of types (lowercase tuple, case-insensitive match).
+    Directories are walked with os.scandir using an explicit stack, so DirEntry paths and cached file types are
+    used instead of os.path.join and extra stat calls; symlinked directories are not followed.
+    """
     photo_list = list()
-    for dir, subdir, file in os.walk(folder):
-        for filename in file:
-            if (filename.lower().endswith(types)):
-                photo_list.append(os.path.join(dir, filename))
-    return (photo_list)
+    stack = [os.fspath(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(types):
+                    photo_list.append(entry.path)
+    return photo_list
 
 
 def proc_rgb():
@@ -193,12 +202,12 @@ def proc_rgb():
 
         # shift coordinates in the chunk
         for camera in chunk.cameras:
-            if not camera.label == camera.master.label:
+            if camera.label != camera.master.label:
                 continue
-            if not camera.reference.location:
+            location = camera.reference.location
+            if not location:
                 continue
-            else:
-                camera.reference.location = camera.reference.location + P1_shift
+            camera.reference.location = location + P1_shift
 
     # Convert to projected coordinate system
     target_crs = Metashape.CoordinateSystem("EPSG::" + args.crs)
@@ -392,26 +401,31 @@ def proc_multispec():
 
     # ret_micasense_pos wrote Altitude = 0 (last column) for MicaSense images that triggered when P1 did not.
     # Create a list of cameras with Altitude = 0
-    del_camera_names = list()
+    del_camera_names = set()
 
     # Only look at altitude of master band images
     for camera in chunk.cameras:
-        if not camera.label == camera.master.label:
+        label = camera.label
+        if label != camera.master.label:
             continue
-        if not camera.reference.location:
+        location = camera.reference.location
+        if not location:
             continue
-        if camera.reference.location.z == 0:
-            del_camera_names.append(camera.label)
+        if location.z == 0:
+            del_camera_names.add(label)
 
     # Delete images outside of P1 capture times
     print("Deleting MicaSense images that triggered outside P1 capture times")
+    to_remove = []
     for camera in chunk.cameras:
         # Only calibration images are in a group. The following line is necessary to avoid NoneType error on other images
         if camera.group is not None:
             if camera.group.label == 'Calibration images':
                 continue
         if camera.label in del_camera_names:
-            chunk.remove(camera)
+            to_remove.append(camera)
+    if to_remove:
+        chunk.remove(to_remove)
 
     # save project
     doc.save()
@@ -690,9 +704,7 @@ else:
 
 # Used to find chunks in proc_*
 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
+dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
 # Delete 'Chunk 1' that is created by default.
 if 'Chunk 1' in dict_chunks:
@@ -68,11 +68,12 @@ Summary:
 """
 
 import argparse
-import math
 import collections
 import numpy as np
 import Metashape
 import os
+import shutil
+import subprocess
 import sys
 import exifread
 from collections import defaultdict
@@ -82,9 +83,14 @@ import upd_micasense_pos
 import csv
 import logging
 from datetime import datetime
+from functools import lru_cache
 
 
-importlib.reload(upd_micasense_pos)
+# Pick up edits to upd_micasense_pos when re-running from the Metashape console during development
+if os.environ.get('DEV_RELOAD'):
+    importlib.reload(upd_micasense_pos)
+    from upd_micasense_pos import ret_micasense_pos
+
 from pathlib import Path
 
 
@@ -92,15 +98,22 @@ from pathlib import Path
 # "C:\Program Files\Agisoft\Metashape Pro\python\python.exe" -m pip install <modulename>
 # See M300 data processing protocol for more information.
 
-# GPU enabled
-
-
 # Metashape Python API updates in v2.0
 METASHAPE_V2_PLUS = False
 found_version = Metashape.app.version.split('.')  # e.g. 2.0.1
 if int(found_version[0]) >= 2:
     METASHAPE_V2_PLUS = True
 
+# Deflate compresses the float reflectance rasters smaller than LZW. The Metashape 2.x API offers None, LZW, JPEG,
+# Packbits and Deflate (no ZSTD); builds without Deflate fall back to LZW. The Python API does not expose the TIFF
+# predictor, so Metashape's default is used. The codec in use is logged at startup.
+TIFF_COMPRESSION_NAME = "Deflate" if hasattr(Metashape.ImageCompression, "TiffCompressionDeflate") else "LZW"
+TIFF_COMPRESSION_TYPE = getattr(Metashape.ImageCompression, "TiffCompression" + TIFF_COMPRESSION_NAME)
+# Metashape does not expose overview levels or TIFF block size. With -gdal_overviews the orthomosaics are exported
+# without overviews and gdaladdo builds these levels afterwards (multi-threaded, averaged).
+OVERVIEW_LEVELS = (2, 4, 8, 16, 32)
+GDALADDO = shutil.which("gdaladdo")
+
 ###############################################################################
 # BASE DIRECTORY If you run multiple projects, update this path
 # Decoide if you want to use model or DEM or for Orthomoasaic
@@ -120,6 +133,8 @@ SOURCE_CRS = Metashape.CoordinateSystem("EPSG::4326")  # WGS84
 
 CONST_a = 6378137  # Semi major axis
 CONST_inv_f = 298.257223563  # Inverse flattening 1/f WGS84 ellipsoid
+CONST_f = 1 / CONST_inv_f  # Flattening
+CONST_e_sq = 2 * CONST_f - CONST_f ** 2  # Eccentricity squared
 # Chunks in Metashape
 CHUNK_RGB = "rgb"
 CHUNK_MULTISPEC = "multispec"
@@ -128,6 +143,11 @@ IMG_QUAL_THRESHOLD = 0.7
 
 DICT_SMOOTH_STRENGTH = {'low': 50, 'medium': 100, 'high': 200}
 
+# Lowercase, without the dot, as in the IMG_EXTENSIONS of the other scripts
+IMG_EXTENSIONS = frozenset({'jpg', 'jpeg', 'tif', 'tiff'})
+# Sidecar file in the MicaSense folder holding the camera model, so batch re-runs skip the EXIF read
+CAM_MODEL_CACHE_FILE = ".cam_model"
+
 # Lever-arm offsets for different sensors on *Matrice 300*
 # TODO: update this for other sensors and drone platforms
 P1_GIMBAL1_OFFSET = (0.087, 0.0, 0.0)
@@ -144,6 +164,32 @@ offset_dict['RedEdge-P']['Dual'] = (0,0,0)
 ###############################################################################
 # Function definitions
 ###############################################################################
+def _make_compression(overviews=True):
+    """Tiled BigTIFF with TIFF_COMPRESSION_TYPE, by default with internal overviews, used for all raster exports"""
+    compression = Metashape.ImageCompression()
+    compression.tiff_compression = TIFF_COMPRESSION_TYPE
+    compression.tiff_big = True
+    compression.tiff_tiled = True
+    compression.tiff_overviews = overviews
+    return compression
+
+TIFF_COMPRESSION = _make_compression()
+TIFF_COMPRESSION_NO_OVERVIEWS = _make_compression(overviews=False)
+
+def build_overviews(raster_file):
+    """
+    Add internal overviews at OVERVIEW_LEVELS to raster_file with gdaladdo (average resampling, all CPU threads).
+    Returns True on success; on failure the error is logged and the raster is left without overviews.
+    """
+    command = [GDALADDO, "-r", "average", "--config", "COMPRESS_OVERVIEW", TIFF_COMPRESSION_NAME.upper(),
+               "--config", "GDAL_NUM_THREADS", "ALL_CPUS", str(raster_file), *map(str, OVERVIEW_LEVELS)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.warning("gdaladdo failed for %s: %s", raster_file, result.stderr.strip())
+        return False
+    logging.info("Built overviews for %s", raster_file)
+    return True
+
 def setup_logging(project_path):
     """Configure logging to file and console"""
     log_dir = Path(project_path).parent / "logs"
@@ -176,43 +222,121 @@ def cartesian_to_geog(X, Y, Z):
     """
     Author: Poornima Sivanandam
     Convert Cartesian coordinates to geographic coordinates using WGS84 ellipsoid.
+    X, Y, Z can be scalars or numpy arrays of the same shape, so many points are converted in one call.
     Return Lat, Lon, ellipsoidal height as a named tuple.
-    Calculations from Transformation_Conversion.xlsx at https://github.com/icsm-au/DatumSpreadsheets
+    Closed-form solution from Vermeille (2004), Direct transformation from geocentric coordinates to geodetic
+    coordinates, Journal of Geodesy 76: exact for points outside the ellipsoid's evolute (i.e. not within
+    ~43 km of the Earth's centre).
     """
-    f = 1 / CONST_inv_f
-    e_sq = 2 * f - f ** 2
-    p = math.sqrt(X ** 2 + Y ** 2)
-    r = math.sqrt(p ** 2 + Z ** 2)
-    mu = math.atan((Z / p) * (1 - f) + (e_sq * CONST_a) / r)
-
-    lat_top_line = Z * (1 - f) + e_sq * CONST_a * math.sin(mu) ** 3
-    lat_bottom_line = (1 - f) * (p - e_sq * CONST_a * math.cos(mu) ** 3)
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    Z = np.asarray(Z, dtype=np.float64)
+
+    p_sq = X ** 2 + Y ** 2
+    p = p_sq / CONST_a ** 2
+    q = (1 - CONST_e_sq) / CONST_a ** 2 * Z ** 2
+    r = (p + q - CONST_e_sq ** 2) / 6
+    s = CONST_e_sq ** 2 * p * q / (4 * r ** 3)
+    t = np.cbrt(1 + s + np.sqrt(s * (2 + s)))
+    u = r * (1 + t + 1 / t)
+    v = np.sqrt(u ** 2 + CONST_e_sq ** 2 * q)
+    w = CONST_e_sq * (u + v - q) / (2 * v)
+    k = np.sqrt(u + v + w ** 2) - w
+    D = k * np.sqrt(p_sq) / (k + CONST_e_sq)
+    D_Z = np.sqrt(D ** 2 + Z ** 2)
+
+    # atan2 gives the longitude in the correct quadrant directly (no division by X)
+    lon = np.arctan2(Y, X)
+    lat = 2 * np.arctan2(Z, D + D_Z)
+
+    lon_dec_deg = np.degrees(lon)
+    lat_dec_deg = np.degrees(lat)
+
+    ellip_h = (k + CONST_e_sq - 1) / k * D_Z
+
+    conv_coord = GEOG_COORD(lat_dec_deg[()], lon_dec_deg[()], ellip_h[()])
 
-    lon = math.atan(Y / X)
-    lat = math.atan(lat_top_line / lat_bottom_line)
-
-    if (lon < 0):
-        tmp_lon = lon + math.pi
-    else:
-        tmp_lon = lon
-
-    lon_dec_deg = (tmp_lon / math.pi) * 180
-    lat_dec_deg = (lat / math.pi) * 180
-
-    ellip_h = p * math.cos(lat) + Z * math.sin(lat) - CONST_a * math.sqrt(1 - e_sq * math.sin(lat) ** 2)
+    return conv_coord
 
-    conv_coord = GEOG_COORD(lat_dec_deg, lon_dec_deg, ellip_h)
 
-    return conv_coord
+def image_quality(cameras):
+    """
+    Return the Image/Quality of each camera as a float64 array, reading every camera's meta once right after
+    analyzeImages. Cameras without a quality value get NaN, so they never fall below a threshold.
+    """
+    qualities = [camera.meta["Image/Quality"] for camera in cameras]
+    return np.fromiter((np.nan if qual is None else float(qual) for qual in qualities), dtype=np.float64,
+                       count=len(qualities))
 
 
 def find_files(folder, types):
+    """
+    Return paths of all files under folder whose lowercase extension is in types (given with or without the dot).
+    Directories are walked with os.scandir using an explicit stack, so no Path objects or extra stat calls
+    are made per entry; symlinked directories are not followed.
+    """
+    types = frozenset(t.lstrip('.').lower() for t in types)
     photo_list = list()
-    for dir, subdir, file in os.walk(folder):
-        for filename in file:
-            if (filename.lower().endswith(types)):
-                photo_list.append(os.path.join(dir, filename))
-    return (photo_list)
+    stack = [os.fspath(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                _, dot, ext = entry.name.rpartition('.')
+                if dot and ext.lower() in types:
+                    photo_list.append(entry.path)
+    return photo_list
+
+def first_file(folder, types):
+    """
+    Return the path of the first file under folder whose lowercase extension is in types (given with or without
+    the dot), or None. Directories are walked breadth-first and the walk stops at the first match.
+    """
+    types = frozenset(t.lstrip('.').lower() for t in types)
+    queue = collections.deque([os.fspath(folder)])
+    while queue:
+        subdirs = []
+        with os.scandir(queue.popleft()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    _, dot, ext = entry.name.rpartition('.')
+                    if dot and ext.lower() in types:
+                        return entry.path
+        queue.extend(sorted(subdirs))
+    return None
+
+@lru_cache(maxsize=64)
+def get_cam_model(micasense_path):
+    """
+    Return the MicaSense camera model from the EXIF of the first image in micasense_path. Known models are
+    stored in CAM_MODEL_CACHE_FILE in that folder and read from there on later runs.
+    """
+    cache_file = Path(micasense_path) / CAM_MODEL_CACHE_FILE
+    if cache_file.is_file():
+        cam_model = cache_file.read_text().strip()
+        if cam_model in offset_dict:
+            return cam_model
+        # Stale or edited sidecar with an unknown model: read the EXIF again (and rewrite it below)
+
+    sample_image = first_file(micasense_path, IMG_EXTENSIONS)
+    if sample_image is None:
+        raise FileNotFoundError(f"No MicaSense images found in {micasense_path}")
+    # Only the model tag is needed: skip MakerNote/thumbnail parsing and stop once it is read.
+    # exifread matches stop_tag against the bare tag name, i.e. 'Model' for 'Image Model'.
+    with open(sample_image, 'rb') as sample_img:
+        exif_tags = exifread.process_file(sample_img, details=False, stop_tag='Model', strict=False)
+    cam_model = str(exif_tags.get('Image Model'))
+    if cam_model in offset_dict:
+        try:
+            cache_file.write_text(cam_model)
+        except OSError:
+            # Read-only data folder: just skip caching
+            pass
+    return cam_model
 
 def copyBoundingBox(from_chunk_label, to_chunk_label):
     print("Script started...")
@@ -275,6 +399,9 @@ def proc_rgb():
 
     chunk = doc.findChunk(dict_chunks[CHUNK_RGB])
     proj_file = doc.path
+    proj_path = Path(proj_file)
+    proj_dir = proj_path.parent
+    proj_stem = proj_path.stem
     blockshift_p1 = False
 
     if args.drtk is not None:
@@ -283,38 +410,46 @@ def proc_rgb():
         print("P1 blockshift set")
 
         # read from txt/csv cartesian for RTK initial (line 1) and AUSPOS coords (line 2)
-        with open(DRTK_TXT_FILE, 'r') as file:
-            line = file.readline()
-            split_line = line.split(',')
-            drtk_field = cartesian_to_geog(float(split_line[0]), float(split_line[1]), float(split_line[2]))
-            line = file.readline()
-            split_line = line.split(',')
-            drtk_auspos = cartesian_to_geog(float(split_line[0]), float(split_line[1]), float(split_line[2]))
-
-        # calc difference
-        diff_lat = round((drtk_auspos.lat_decdeg - drtk_field.lat_decdeg), 6)
-        diff_lon = round((drtk_auspos.lon_decdeg - drtk_field.lon_decdeg), 6)
-        diff_elliph = round((drtk_auspos.elliph - drtk_field.elliph), 6)
-        P1_shift = Metashape.Vector((diff_lon, diff_lat, diff_elliph))
+        xyz = np.loadtxt(DRTK_TXT_FILE, delimiter=',', usecols=(0, 1, 2), max_rows=2, ndmin=2)
+        drtk = cartesian_to_geog(xyz[:, 0], xyz[:, 1], xyz[:, 2])
+
+        # calc difference AUSPOS - field as (lon, lat, ellipsoidal height), the axis order of the rgb chunk
+        geog = np.column_stack((drtk.lon_decdeg, drtk.lat_decdeg, drtk.elliph))
+        shift = np.round(geog[1] - geog[0], 6)
+        P1_shift = Metashape.Vector(shift.tolist())
 
         print("Shifting P1 cameras by: " + str(P1_shift))
 
-        # shift coordinates in the chunk
-        for camera in chunk.cameras:
-            if not camera.label == camera.master.label:
-                continue
-            if not camera.reference.location:
-                continue
-            else:
-                camera.reference.location = camera.reference.location + P1_shift
+    # Camera reference locations (lon, lat, h) are pulled into one array, blockshifted and converted to the
+    # projected coordinate system there, and written back to the chunk once.
+    cameras = list(chunk.cameras)
+    refs = [camera.reference.location for camera in cameras]
+    has_loc = np.array([bool(loc) for loc in refs], dtype=bool)
+    locations = np.array([(loc.x, loc.y, loc.z) if loc else (0.0, 0.0, 0.0) for loc in refs],
+                         dtype=np.float64).reshape(-1, 3)
+    update_mask = np.zeros(len(cameras), dtype=bool)
+
+    if blockshift_p1:
+        # shift coordinates of master cameras with a reference location in the chunk
+        is_master = np.array([camera.label == camera.master.label for camera in cameras], dtype=bool)
+        shift_mask = is_master & has_loc
+        locations[shift_mask] += shift
+        update_mask |= shift_mask
 
     # Convert to projected coordinate system
-    target_crs = Metashape.CoordinateSystem("EPSG::" + args.crs)
-    for camera in chunk.cameras:
-        if not camera.reference.location:
-            continue
-        camera.reference.location = Metashape.CoordinateSystem.transform(camera.reference.location, SOURCE_CRS,
-                                                                         target_crs)
+    # All camera positions go through one 3D pyproj call (same pipeline selection as upd_micasense_pos), so the
+    # heights get the same datum transformation as with Metashape.CoordinateSystem.transform per camera.
+    # Nothing to do if the target is WGS84 itself.
+    target_crs = TARGET_CRS
+    if EPSG_CRS != upd_micasense_pos.EPSG_4326 and has_loc.any():
+        # The transformer takes (lat, lon, h) and returns (E, N, h)
+        eastings, northings, heights = upd_micasense_pos.get_transformer(EPSG_CRS, three_d=True).transform(
+            locations[has_loc, 1], locations[has_loc, 0], locations[has_loc, 2])
+        locations[has_loc] = np.column_stack((eastings, northings, heights))
+        update_mask |= has_loc
+
+    for idx in np.flatnonzero(update_mask).tolist():
+        cameras[idx].reference.location = Metashape.Vector(locations[idx].tolist())
 
     chunk.crs = target_crs
 
@@ -325,10 +460,24 @@ def proc_rgb():
                               delimiter=",", items=Metashape.ReferenceItemsCameras)
 
         # If P1  blockshifted, pass vector for x, y, z shift of micasense image position
-        P1_shift_vec = np.array([diff_lat, diff_lon, diff_elliph])
+        # upd_micasense_pos expects (lat, lon, ellipsoidal height)
+        P1_shift_vec = shift[[1, 0, 2]].copy()
     else:
         P1_shift_vec = np.array([0.0, 0.0, 0.0])
 
+    #
+    # GPS/INS offset
+    #
+    # Offset and position accuracy do not depend on image quality, so they are set before analyzeImages
+    # and saved together with the blockshift. Only the quality filter has to run before matchPhotos.
+    print(chunk.sensors[0].antenna.location_ref)
+    print("Update GPS/INS offset for P1")
+    chunk.sensors[0].antenna.location_ref = Metashape.Vector(P1_GIMBAL1_OFFSET)
+    print(chunk.sensors[0].antenna.location_ref)
+
+    # change camera position accuracy to 0.1 m
+    chunk.camera_location_accuracy = Metashape.Vector((0.10, 0.10, 0.10))
+
     doc.save()
 
     #
@@ -338,28 +487,18 @@ def proc_rgb():
         chunk.analyzeImages()
     else:
         chunk.analyzePhotos()
-    low_img_qual = []
-    low_img_qual = [camera for camera in chunk.cameras if (float(camera.meta["Image/Quality"]) < IMG_QUAL_THRESHOLD)]
+    cameras = list(chunk.cameras)
+    quals = image_quality(cameras)
+    low_img_qual = [cameras[idx] for idx in np.flatnonzero(quals < IMG_QUAL_THRESHOLD).tolist()]
     if low_img_qual:
         print("Removing cameras with Image Quality < %.1f" % IMG_QUAL_THRESHOLD)
         chunk.remove(low_img_qual)
     doc.save()
 
-    
-    #
-    # GPS/INS offset
-    #
-    print(chunk.sensors[0].antenna.location_ref)
-    print("Update GPS/INS offset for P1")
-    chunk.sensors[0].antenna.location_ref = Metashape.Vector(P1_GIMBAL1_OFFSET)
-    print(chunk.sensors[0].antenna.location_ref)
-
     #
     # Align Photos
     #
     print("Aligning Cameras")
-    # change camera position accuracy to 0.1 m
-    chunk.camera_location_accuracy = Metashape.Vector((0.10, 0.10, 0.10))
 
     # Downscale values per https://www.agisoft.com/forum/index.php?topic=11697.0
     # Downscale: highest, high, medium, low, lowest: 0, 1, 2, 4, 8
@@ -423,17 +562,13 @@ def proc_rgb():
         smooth_val = DICT_SMOOTH_STRENGTH[args.smooth]
         chunk.smoothModel(smooth_val)
         # Export model for use in micasense chunk
-        model_file = Path(proj_file).parent / (Path(proj_file).stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
+        model_file = proj_dir / f"{proj_stem}_rgb_smooth_{smooth_val}.obj"
         chunk.exportModel(path=str(model_file), crs=target_crs, format=Metashape.ModelFormatOBJ)
 
     #
     # Build DEM
     #
-    compression = Metashape.ImageCompression()
-    compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW  # default on Metashape
-    compression.tiff_big = True
-    compression.tiff_tiled = True
-    compression.tiff_overviews = True
+    compression = TIFF_COMPRESSION
     
     if use_dem:
         print("Build DEM")
@@ -447,7 +582,7 @@ def proc_rgb():
             chunk.buildDem(source_data=Metashape.DenseCloudData,resolution = dem_res_xy )
         doc.save()
 
-        dem_file = Path(proj_file).parent / (Path(proj_file).stem + "_dem_01.tif")
+        dem_file = proj_dir / f"{proj_stem}_dem_01.tif"
 
         chunk.exportRaster(path=str(dem_file), source_data=Metashape.ElevationData, image_format=Metashape.ImageFormatTIFF, image_compression=compression)
         #include test variable for debugging:
@@ -475,7 +610,7 @@ def proc_rgb():
             # else save ortho in rgb/level1_proc/
             p1_idx = MRK_PATH.find("rgb")
             if p1_idx == -1:
-                dir_path = Path(proj_file).parent
+                dir_path = proj_dir
                 print("Cannot find rgb/ folder. Saving ortho in " + str(dir_path))
             else:
                 # create p1/level1_proc folder if it does not exist
@@ -483,16 +618,16 @@ def proc_rgb():
                 dir_path.mkdir(parents=True, exist_ok=True)
 
             # file naming format: <projname>_rgb_ortho_<res_in_m>.tif
-            ortho_file = dir_path / (
-                    Path(proj_file).stem + "_rgb_ortho_01.tif")
+            ortho_file = dir_path / f"{proj_stem}_rgb_ortho_01.tif"
 
 
             chunk.exportRaster(path=str(ortho_file), resolution_x=res_xy, resolution_y=res_xy,
-                               image_format=Metashape.ImageFormatTIFF,
-                               save_alpha=False, source_data=Metashape.OrthomosaicData, image_compression=compression)
-            print("Exported orthomosaic " + str(ortho_file))
-
-            logging.info(f"Exported RGB orthomosaic: {ortho_file}")
+                               image_format=Metashape.ImageFormatTIFF, save_alpha=False,
+                               source_data=Metashape.OrthomosaicData,
+                               image_compression=TIFF_COMPRESSION_NO_OVERVIEWS if USE_GDALADDO else compression)
+            if USE_GDALADDO:
+                build_overviews(ortho_file)
+            logging.info("Exported RGB orthomosaic: %s", ortho_file)
             print(f"OUTPUT_ORTHO_RGB: {ortho_file}")
 
 
@@ -500,13 +635,12 @@ def proc_rgb():
             print("Skipping orthomosaic building and exporting due to test mode.")
 
         # Export the processing report
-        report_path = dir_path / (
-                    Path(proj_file).stem + "_rgb_report.pdf")
+        report_path = dir_path / f"{proj_stem}_rgb_report.pdf"
         print(f"Exporting processing report to {report_path}...")
         chunk.exportReport(path = str(report_path))
         doc.save()
 
-        logging.info(f"Exported RGB report: {report_path}")
+        logging.info("Exported RGB report: %s", report_path)
         print(f"OUTPUT_REPORT_RGB: {report_path}")
 
         print("RGB chunk processing complete!")
@@ -535,8 +669,10 @@ def proc_multispec():
     """
 
     chunk = doc.findChunk(dict_chunks[CHUNK_MULTISPEC])
+    proj_dir = PROJ_PARENT
+    proj_stem = PROJ_STEM
 
-    target_crs = Metashape.CoordinateSystem("EPSG::" + args.crs)
+    target_crs = TARGET_CRS
 
     # Get image suffix of master camera
     camera = chunk.cameras[0]
@@ -567,26 +703,23 @@ def proc_multispec():
 
     # ret_micasense_pos wrote Altitude = 0 (last column) for MicaSense images that triggered when P1 did not.
     # Create a list of cameras with Altitude = 0
-    del_camera_names = list()
-
     # Only look at altitude of master band images
-    for camera in chunk.cameras:
-        if not camera.label == camera.master.label:
-            continue
-        if not camera.reference.location:
-            continue
-        if camera.reference.location.z == 0:
-            del_camera_names.append(camera.label)
+    cameras = list(chunk.cameras)
+    labels = [camera.label for camera in cameras]
+    is_master = np.array([label == camera.master.label for label, camera in zip(labels, cameras)], dtype=bool)
+    refs = [camera.reference.location for camera in cameras]
+    alt = np.array([loc.z if loc else np.nan for loc in refs], dtype=np.float64)
+    del_camera_names = {labels[idx] for idx in np.flatnonzero(is_master & (alt == 0)).tolist()}
 
     # Delete images outside of P1 capture times
     print("Deleting MicaSense images that triggered outside P1 capture times")
-    for camera in chunk.cameras:
-        # Only calibration images are in a group. The following line is necessary to avoid NoneType error on other images
-        if camera.group is not None:
-            if camera.group.label == 'Calibration images':
-                continue
-        if camera.label in del_camera_names:
-            chunk.remove(camera)
+    # Only calibration images are in a group. The group check is necessary to avoid NoneType error on other images
+    calib_keys = {camera.key for camera in cameras
+                  if camera.group is not None and camera.group.label == 'Calibration images'}
+    to_remove = [camera for camera, label in zip(cameras, labels)
+                 if label in del_camera_names and camera.key not in calib_keys]
+    if to_remove:
+        chunk.remove(to_remove)
 
     # Disable images outside of P1 capture times
     # print("Disabling MicaSense images that triggered outside P1 capture times")
@@ -628,23 +761,22 @@ def proc_multispec():
     print("Updating Raster Transform for relative reflectance")
     raster_transform_formula = []
     num_bands = len(chunk.sensors)
+    bands = np.arange(1, num_bands + 1)
     if cam_model == 'RedEdge-M':
-        for band in range(1, num_bands + 1):
-            raster_transform_formula.append("B" + str(band) + "/32768")
+        raster_transform_formula = [f"B{band}/32768" for band in bands.tolist()]
     elif cam_model == 'RedEdge-P':
         # Skip Panchromatic band in multispec ortho.
         # Panchro band: wavelength: 634.5 nm, Band 5 in RedEdge-P Dual and Band 3 in RedEdge-P.
-        if num_bands >= 10:
-            PANCHRO_BAND = 5
-        else:
-            PANCHRO_BAND = 3
-        for band in range(1, num_bands+1):
-            if band != PANCHRO_BAND:
-                raster_transform_formula.append("B" + str(band) + "/32768")
+        PANCHRO_BAND = 5 if num_bands >= 10 else 3
+        bands = bands[bands != PANCHRO_BAND]
+        raster_transform_formula = [f"B{band}/32768" for band in bands.tolist()]
 
     chunk.raster_transform.formula = raster_transform_formula
     chunk.raster_transform.calibrateRange()
     chunk.raster_transform.enabled = True
+
+    # change camera position accuracy to 0.1 m (independent of image quality, see proc_rgb)
+    chunk.camera_location_accuracy = Metashape.Vector((0.10, 0.10, 0.10))
     doc.save()
 
     #
@@ -654,8 +786,9 @@ def proc_multispec():
         chunk.analyzeImages()
     else:
         chunk.analyzePhotos()
-    low_img_qual = []
-    low_img_qual = [camera.master for camera in chunk.cameras if (float(camera.meta["Image/Quality"]) < 0.5)]
+    cameras = list(chunk.cameras)
+    quals = image_quality(cameras)
+    low_img_qual = [cameras[idx].master for idx in np.flatnonzero(quals < 0.5).tolist()]
     if low_img_qual:
         print("Removing cameras with Image Quality < %.1f" % 0.5)
         chunk.remove(list(set(low_img_qual)))
@@ -669,9 +802,6 @@ def proc_multispec():
     #
     # Align Photos
     #
-    # change camera position accuracy to 0.1 m
-    chunk.camera_location_accuracy = Metashape.Vector((0.10, 0.10, 0.10))
-
     # Downscale values per https://www.agisoft.com/forum/index.php?topic=11697.0
     # Downscale: highest, high, medium, low, lowest: 0, 1, 2, 4, 8 # to be set below
     # Quality:  High, Reference Preselection: Source
@@ -705,7 +835,7 @@ def proc_multispec():
     if use_model:
         # Import P1 model for use in orthorectification
         smooth_val = DICT_SMOOTH_STRENGTH[args.smooth]
-        model_file = Path(proj_file).parent / (Path(proj_file).stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
+        model_file = proj_dir / f"{proj_stem}_rgb_smooth_{smooth_val}.obj"
         chunk.importModel(path=str(model_file), crs=target_crs, format=Metashape.ModelFormatOBJ)
 
         print("Build orthomosaic")
@@ -714,7 +844,7 @@ def proc_multispec():
 
     if use_dem:
         dem_res_xy = 0.01  # Define the resolution for DEM
-        dem_file = Path(proj_file).parent / (Path(proj_file).stem + "_dem_01.tif")
+        dem_file = proj_dir / f"{proj_stem}_dem_01.tif"
         chunk.importRaster(path=str(dem_file), crs=target_crs, format=Metashape.ImageFormatTIFF)
 
         print("Build orthomosaic")
@@ -729,7 +859,7 @@ def proc_multispec():
         # else save ortho in multispec/level1_proc/
         micasense_idx = MICASENSE_PATH.find("multispec")
         if micasense_idx == -1:
-            dir_path = Path(proj_file).parent
+            dir_path = proj_dir
             print("Cannot find " + "multispec/ folder. Saving ortho in " + str(dir_path))
         else:
             # create multispec/level1_proc/ folder if it does not exist
@@ -737,27 +867,29 @@ def proc_multispec():
             dir_path.mkdir(parents=True, exist_ok=True)
 
         # file naming format: <projname>_multispec_ortho_<res_in_m>.tif
-        ortho_file = dir_path / (
-                Path(proj_file).stem + "_" + "multispec_ortho_" + str(res_xy).split('.')[1] + ".tif")
+        ortho_file = dir_path / f"{proj_stem}_multispec_ortho_{str(res_xy).split('.')[1]}.tif"
 
-        compression = Metashape.ImageCompression()
-        compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW  # default on Metashape
-        compression.tiff_big = True
-        compression.tiff_tiled = True
-        compression.tiff_overviews = True
+        compression = TIFF_COMPRESSION
+
+        # Apply the reflectance transform only if one was set up above (RedEdge-M/P); otherwise export raw values
+        # and skip Metashape's per-pixel transform pass
+        if chunk.raster_transform.enabled and chunk.raster_transform.formula:
+            raster_transform = Metashape.RasterTransformValue
+        else:
+            raster_transform = Metashape.RasterTransformNone
 
         chunk.exportRaster(path=str(ortho_file), resolution_x=res_xy, resolution_y=res_xy,
                            image_format=Metashape.ImageFormatTIFF,
-                           raster_transform=Metashape.RasterTransformValue,
-                           save_alpha=False, source_data=Metashape.OrthomosaicData, image_compression=compression)
-        print("Exported orthomosaic: " + str(ortho_file))
-
-        logging.info(f"Exported multispec orthomosaic: {ortho_file}")
+                           raster_transform=raster_transform,
+                           save_alpha=False, source_data=Metashape.OrthomosaicData,
+                           image_compression=TIFF_COMPRESSION_NO_OVERVIEWS if USE_GDALADDO else compression)
+        if USE_GDALADDO:
+            build_overviews(ortho_file)
+        logging.info("Exported multispec orthomosaic: %s", ortho_file)
         print(f"OUTPUT_ORTHO_MS: {ortho_file}")
 
     # Export the processing report
-    report_path = dir_path / (
-                Path(proj_file).stem + "_multispec_report.pdf")
+    report_path = dir_path / f"{proj_stem}_multispec_report.pdf"
     print(f"Exporting processing report to {report_path}...")
     chunk.exportReport(path = str(report_path))
 
@@ -765,7 +897,7 @@ def proc_multispec():
     
     # write to logfile
 
-    logging.info(f"Exported multispec report: {report_path}")
+    logging.info("Exported multispec report: %s", report_path)
     print(f"OUTPUT_REPORT_MS: {report_path}")
         
     print("Multispec chunk processing complete!")
@@ -775,25 +907,24 @@ def proc_multispec():
 def write_arguments_to_csv():
     global BASE_DIR
     csv_file = os.path.join(BASE_DIR, "arguments_logstep2.csv")
-    headers = ["proj_path"] + [arg for arg in vars(args).keys()]
+    arg_names = list(vars(args))
 
     # Collect argument values
-    row = [proj_file] + [str(getattr(args, arg)) for arg in vars(args).keys()]
-
-    # Check if the row already exists in the CSV file
-    if os.path.exists(csv_file):
-        with open(csv_file, mode='r', newline='') as file:
-            reader = csv.reader(file)
-            for existing_row in reader:
-                if existing_row == row:
-                    print("Row already exists in the CSV file. Skipping writing.")
-                    return
-
-    # Write the row to the CSV file
-    with open(csv_file, mode='a', newline='') as file:
+    row = [proj_file] + [str(getattr(args, arg)) for arg in arg_names]
+
+    # Open the CSV file once: scan it for the row from the start, then append (a+ always writes at the end)
+    with open(csv_file, mode='a+', newline='') as file:
+        file.seek(0)
+        # Check if the row already exists in the CSV file
+        for existing_row in csv.reader(file):
+            if existing_row == row:
+                print("Row already exists in the CSV file. Skipping writing.")
+                return
+
+        # Write the row to the CSV file
         writer = csv.writer(file)
         if file.tell() == 0:
-            writer.writerow(headers)  # Write headers if file is empty
+            writer.writerow(["proj_path"] + arg_names)  # Write headers if file is empty
         writer.writerow(row)
         print("Arguments written to CSV file.")
 
@@ -834,13 +965,36 @@ parser.add_argument('-drtk', help='If RGB coordinates to be blockshifted, file c
 parser.add_argument('-sunsens', help='use sun sensor data for reflectance calibration', action='store_true')
 parser.add_argument('-test', help='make processing faster for debugging', action='store_true')
 parser.add_argument('-multionly', help='process multispec chunk only', action='store_true')
+parser.add_argument('-gpu_mask', help='bit mask of GPU devices to use, e.g. 1 or 0b11. Default: all detected GPUs',
+                    default=None)
+parser.add_argument('-gdal_overviews', help='build orthomosaic overviews with gdaladdo instead of Metashape',
+                    action='store_true')
 
 global args
 args = parser.parse_args()
 
 # Initialize logging first
 setup_logging(args.proj_path)
-logging.info(f"Starting processing for project: {args.proj_path}")
+logging.info("Starting processing for project: %s", args.proj_path)
+logging.info("GeoTIFF exports use %s compression", TIFF_COMPRESSION_NAME)
+
+USE_GDALADDO = args.gdal_overviews and GDALADDO is not None
+if args.gdal_overviews and GDALADDO is None:
+    logging.warning("gdaladdo not found on PATH, orthomosaic overviews are built by Metashape")
+
+# GPU enabled
+# Matching, depth maps and part of meshing run on the GPU. When GPUs are used, leave the CPU out of those steps.
+devices = Metashape.app.enumGPUDevices()
+if args.gpu_mask is not None:
+    Metashape.app.gpu_mask = int(args.gpu_mask, 0)
+else:
+    Metashape.app.gpu_mask = (1 << len(devices)) - 1
+if Metashape.app.gpu_mask:
+    Metashape.app.cpu_enable = False
+logging.info("Detected GPUs in Metashape:")
+for i, device in enumerate(devices):
+    logging.info("  GPU %d: %s%s", i + 1, device['name'],
+                 " (enabled)" if Metashape.app.gpu_mask & (1 << i) else "")
 
 global MRK_PATH, MICASENSE_PATH
 
@@ -849,6 +1003,11 @@ global doc
 
 doc = Metashape.Document()
 proj_file = args.proj_path
+
+# Project location, derived once and reused for default data folders and output files
+PROJ_PARENT = Path(proj_file).parent
+PROJ_PARENTS1 = Path(proj_file).parents[1]
+PROJ_STEM = Path(proj_file).stem
 doc.open(proj_file, read_only=False)  # Open the document in editable mode
     
 
@@ -860,7 +1019,7 @@ if args.rgb:
     MRK_PATH = args.rgb
 else:
     # Default is relative to project location: ../rgb/level0_raw/
-    MRK_PATH = Path(proj_file).parents[1] / "rgb/level0_raw"
+    MRK_PATH = PROJ_PARENTS1 / "rgb/level0_raw"
     if not MRK_PATH.is_dir():
         sys.exit("%s directory does not exist. Check and input paths using -rgb " % str(MRK_PATH))
     else:
@@ -871,7 +1030,7 @@ if args.multispec:
     MICASENSE_PATH = args.multispec
 else:
     # Default is relative to project location: ../multispec/level0_raw/
-    MICASENSE_PATH = Path(proj_file).parents[1] / "multispec/level0_raw"
+    MICASENSE_PATH = PROJ_PARENTS1 / "multispec/level0_raw"
 
     if not MICASENSE_PATH.is_dir():
         sys.exit("%s directory does not exist. Check and input paths using -multispec " % str(MICASENSE_PATH))
@@ -886,6 +1045,10 @@ if args.drtk is not None:
 if args.smooth not in DICT_SMOOTH_STRENGTH:
     sys.exit("Value for -smooth must be one of low, medium or high.")
 
+# Target projected CRS, built once and shared by proc_rgb and proc_multispec
+EPSG_CRS = int(args.crs)
+TARGET_CRS = Metashape.CoordinateSystem("EPSG::" + args.crs)
+
 # Set quality values for the downscale value in RGB and Multispec for testing
 if args.test:
     quality1 = 4 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
@@ -899,9 +1062,9 @@ else:
     print("Default mode: quality1 set to 1, quality2 set to 2, quality3 set to 0")
 
 # Export blockshifted P1 positions. Not used in script. Useful for debug or to restart parts of script following any issues.
-P1_CAM_CSV = Path(proj_file).parent / "dbg_shifted_p1_pos.csv"
+P1_CAM_CSV = PROJ_PARENT / "dbg_shifted_p1_pos.csv"
 # By default save the CSV with updated MicaSense positions in the MicaSense folder. CSV used within script.
-MICASENSE_CAM_CSV = Path(proj_file).parent / "interpolated_micasense_pos.csv"
+MICASENSE_CAM_CSV = PROJ_PARENT / "interpolated_micasense_pos.csv"
 
 ##################
 # Add images
@@ -917,10 +1080,7 @@ if P1_GIMBAL1_OFFSET == 0:
     Metashape.app.messageBox(err_msg)
 
 # MicaSense: get Camera Model from one of the images to check the lever-arm offsets for the relevant model
-micasense_images = find_files(MICASENSE_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
-sample_img = open(micasense_images[0], 'rb')
-exif_tags = exifread.process_file(sample_img)
-cam_model = str(exif_tags.get('Image Model'))
+cam_model = get_cam_model(os.fspath(MICASENSE_PATH))
 
 # HARDCODED number of bands.
 # Dual sensor (RedEdge-MX Dual: 10, RedEdge-P Dual: 11)
@@ -930,20 +1090,22 @@ MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Dual']
 
 # Used to find chunks in proc_*
 check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
+dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
 
+processing_ok = False
 try:
     # VERY IMPORTANT THE ACTUAL PROCESSING HAPPENS HERE
     resume_proc()
+    processing_ok = True
     logging.info("Processing completed successfully")
 except Exception as e:
-    logging.error(f"Processing failed: {str(e)}", exc_info=True)
+    logging.error("Processing failed: %s", e, exc_info=True)
     raise  # Re-raise exception to trigger error in main script
 finally:
-    doc.save()
-    logging.info("Project saved")
+    # proc_multispec already saves the project as its last step; save here only if processing stopped early
+    if not processing_ok:
+        doc.save()
+        logging.info("Project saved")
 print("DONE WITH PROJ:", proj_file)
 
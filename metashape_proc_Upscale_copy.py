@@ -81,7 +81,9 @@ import importlib
 import upd_micasense_pos
 import csv
 import logging
+from dataclasses import dataclass, fields
 from datetime import datetime
+from typing import Optional
 import TransformHeight
 
 
@@ -99,6 +101,12 @@ found_version = Metashape.app.version.split('.')  # e.g. 2.0.1
 if int(found_version[0]) >= 2:
     METASHAPE_V2_PLUS = True
 
+# Deflate compresses the float reflectance rasters smaller than LZW. The Metashape 2.x API offers None, LZW, JPEG,
+# Packbits and Deflate (no ZSTD); builds without Deflate fall back to LZW. The Python API does not expose the TIFF
+# predictor, so Metashape's default is used. The codec in use is logged at startup.
+TIFF_COMPRESSION_NAME = "Deflate" if hasattr(Metashape.ImageCompression, "TiffCompressionDeflate") else "LZW"
+TIFF_COMPRESSION_TYPE = getattr(Metashape.ImageCompression, "TiffCompression" + TIFF_COMPRESSION_NAME)
+
 ###############################################################################
 # BASE DIRECTORY If you run multiple projects, update this path
 # Decoide if you want to use model or DEM or for Orthomoasaic
@@ -205,12 +213,21 @@ def cartesian_to_geog(X, Y, Z):
 
 
 def find_files(folder, types):
+    """
+    Return paths of all files under folder ending in one of types (lowercase tuple, case-insensitive match).
+    Directories are walked with os.scandir using an explicit stack, so DirEntry paths and cached file types are
+    used instead of os.path.join and extra stat calls; symlinked directories are not followed.
+    """
     photo_list = list()
-    for dir, subdir, file in os.walk(folder):
-        for filename in file:
-            if (filename.lower().endswith(types)):
-                photo_list.append(os.path.join(dir, filename))
-    return (photo_list)
+    stack = [os.fspath(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(types):
+                    photo_list.append(entry.path)
+    return photo_list
 
 def copyBoundingBox(from_chunk_label, to_chunk_label):
     print("Script started...")
@@ -273,6 +290,9 @@ def proc_rgb():
 
     chunk = doc.findChunk(dict_chunks[CHUNK_RGB])
     proj_file = doc.path
+    proj_path = Path(proj_file)
+    proj_dir = proj_path.parent
+    proj_stem = proj_path.stem
     blockshift_p1 = False
 
     # Export updated positions as csv for debug purposes. Not used in script.
@@ -303,12 +323,12 @@ def proc_rgb():
 
         # shift coordinates in the chunk
         for camera in chunk.cameras:
-            if not camera.label == camera.master.label:
+            if camera.label != camera.master.label:
                 continue
-            if not camera.reference.location:
+            location = camera.reference.location
+            if not location:
                 continue
-            else:
-                camera.reference.location = camera.reference.location + P1_shift
+            camera.reference.location = location + P1_shift
 
     # Convert to projected coordinate system if necessary
     target_crs = Metashape.CoordinateSystem("EPSG::" + args.crs)
@@ -450,14 +470,14 @@ def proc_rgb():
         smooth_val = DICT_SMOOTH_STRENGTH[args.smooth]
         chunk.smoothModel(smooth_val)
         # Export model for use in micasense chunk
-        model_file = Path(proj_file).parent / (Path(proj_file).stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
+        model_file = proj_dir / (proj_stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
         chunk.exportModel(path=str(model_file), crs=target_crs, format=Metashape.ModelFormatOBJ)
 
     #
     # Build DEM
     #
     compression = Metashape.ImageCompression()
-    compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW  # default on Metashape
+    compression.tiff_compression = TIFF_COMPRESSION_TYPE
     compression.tiff_big = True
     compression.tiff_tiled = True
     compression.tiff_overviews = True
@@ -474,7 +494,7 @@ def proc_rgb():
             chunk.buildDem(source_data=Metashape.DenseCloudData,resolution = dem_res_xy )
         doc.save()
 
-        dem_file = Path(proj_file).parent / (Path(proj_file).stem + "_dem_01.tif")
+        dem_file = proj_dir / (proj_stem + "_dem_01.tif")
 
         chunk.exportRaster(path=str(dem_file), source_data=Metashape.ElevationData, image_format=Metashape.ImageFormatTIFF, image_compression=compression)
         #include test variable for debugging:
@@ -502,7 +522,7 @@ def proc_rgb():
             # else save ortho in rgb/level1_proc/
             p1_idx = MRK_PATH.find("rgb")
             if p1_idx == -1:
-                dir_path = Path(proj_file).parent
+                dir_path = proj_dir
                 print("Cannot find rgb/ folder. Saving ortho in " + str(dir_path))
             else:
                 # create p1/level1_proc folder if it does not exist
@@ -511,7 +531,7 @@ def proc_rgb():
 
             # file naming format: <projname>_rgb_ortho_<res_in_m>.tif
             ortho_file = dir_path / (
-                    Path(proj_file).stem + "_rgb_ortho_01.tif")
+                    proj_stem + "_rgb_ortho_01.tif")
 
 
             chunk.exportRaster(path=str(ortho_file), resolution_x=res_xy, resolution_y=res_xy,
@@ -528,7 +548,7 @@ def proc_rgb():
 
         # Export the processing report
         report_path = dir_path / (
-                    Path(proj_file).stem + "_rgb_report.pdf")
+                    proj_stem + "_rgb_report.pdf")
         print(f"Exporting processing report to {report_path}...")
         chunk.exportReport(path = str(report_path))
         doc.save()
@@ -562,6 +582,8 @@ def proc_multispec():
     """
 
     chunk = doc.findChunk(dict_chunks[CHUNK_MULTISPEC])
+    proj_dir = PROJ_PARENT
+    proj_stem = PROJ_STEM
 
     target_crs = Metashape.CoordinateSystem("EPSG::" + args.crs)
 
@@ -609,26 +631,31 @@ def proc_multispec():
     # Create a list of cameras with Altitude < 0
 
     # Create a list of cameras with Altitude < 0
-    del_camera_names = list()
+    del_camera_names = set()
 
     # Only look at altitude of master band images
     for camera in chunk.cameras:
-        if not camera.label == camera.master.label:
+        label = camera.label
+        if label != camera.master.label:
             continue
-        if not camera.reference.location:
+        location = camera.reference.location
+        if not location:
             continue
-        if camera.reference.location.z <= 0:
-            del_camera_names.append(camera.label)
+        if location.z <= 0:
+            del_camera_names.add(label)
 
     # Delete images outside of P1 capture times
     print("Deleting MicaSense images that triggered outside P1 capture times")
+    to_remove = []
     for camera in chunk.cameras:
         # Only calibration images are in a group. The following line is necessary to avoid NoneType error on other images
         if camera.group is not None:
             if camera.group.label == 'Calibration images':
                 continue
         if camera.label in del_camera_names:
-            chunk.remove(camera)
+            to_remove.append(camera)
+    if to_remove:
+        chunk.remove(to_remove)
 
     # Disable images outside of P1 capture times
     # print("Disabling MicaSense images that triggered outside P1 capture times")
@@ -747,7 +774,7 @@ def proc_multispec():
     if use_model:
         # Import P1 model for use in orthorectification
         smooth_val = DICT_SMOOTH_STRENGTH[args.smooth]
-        model_file = Path(proj_file).parent / (Path(proj_file).stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
+        model_file = proj_dir / (proj_stem + "_rgb_smooth_" + str(smooth_val) + ".obj")
         chunk.importModel(path=str(model_file), crs=target_crs, format=Metashape.ModelFormatOBJ)
 
         print("Build orthomosaic")
@@ -756,7 +783,7 @@ def proc_multispec():
 
     if use_dem:
         dem_res_xy = 0.01  # Define the resolution for DEM
-        dem_file = Path(proj_file).parent / (Path(proj_file).stem + "_dem_01.tif")
+        dem_file = proj_dir / (proj_stem + "_dem_01.tif")
         chunk.importRaster(path=str(dem_file), crs=target_crs, format=Metashape.ImageFormatTIFF)
 
         print("Build orthomosaic")
@@ -771,7 +798,7 @@ def proc_multispec():
         # else save ortho in multispec/level1_proc/
         micasense_idx = MICASENSE_PATH.find("multispec")
         if micasense_idx == -1:
-            dir_path = Path(proj_file).parent
+            dir_path = proj_dir
             print("Cannot find " + "multispec/ folder. Saving ortho in " + str(dir_path))
         else:
             # create multispec/level1_proc/ folder if it does not exist
@@ -780,17 +807,24 @@ def proc_multispec():
 
         # file naming format: <projname>_multispec_ortho_<res_in_m>.tif
         ortho_file = dir_path / (
-                Path(proj_file).stem + "_" + "multispec_ortho_" + str(res_xy).split('.')[1] + ".tif")
+                proj_stem + "_" + "multispec_ortho_" + str(res_xy).split('.')[1] + ".tif")
 
         compression = Metashape.ImageCompression()
-        compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW  # default on Metashape
+        compression.tiff_compression = TIFF_COMPRESSION_TYPE
         compression.tiff_big = True
         compression.tiff_tiled = True
         compression.tiff_overviews = True
 
+        # Apply the reflectance transform only if one was set up above (RedEdge-M/P); otherwise export raw values
+        # and skip Metashape's per-pixel transform pass
+        if chunk.raster_transform.enabled and chunk.raster_transform.formula:
+            raster_transform = Metashape.RasterTransformValue
+        else:
+            raster_transform = Metashape.RasterTransformNone
+
         chunk.exportRaster(path=str(ortho_file), resolution_x=res_xy, resolution_y=res_xy,
                            image_format=Metashape.ImageFormatTIFF,
-                           raster_transform=Metashape.RasterTransformValue,
+                           raster_transform=raster_transform,
                            save_alpha=False, source_data=Metashape.OrthomosaicData, image_compression=compression)
         print("Exported orthomosaic: " + str(ortho_file))
 
@@ -799,7 +833,7 @@ def proc_multispec():
 
     # Export the processing report
     report_path = dir_path / (
-                Path(proj_file).stem + "_multispec_report.pdf")
+                proj_stem + "_multispec_report.pdf")
     print(f"Exporting processing report to {report_path}...")
     chunk.exportReport(path = str(report_path))
 
@@ -817,22 +851,21 @@ def proc_multispec():
 def write_arguments_to_csv():
     global BASE_DIR
     csv_file = os.path.join(BASE_DIR, "arguments_logstep2.csv")
-    headers = ["proj_path"] + [arg for arg in vars(args).keys()]
+    headers = ["proj_path", *ARG_NAMES]
 
     # Collect argument values
-    row = [proj_file] + [str(getattr(args, arg)) for arg in vars(args).keys()]
-
-    # Check if the row already exists in the CSV file
-    if os.path.exists(csv_file):
-        with open(csv_file, mode='r', newline='') as file:
-            reader = csv.reader(file)
-            for existing_row in reader:
-                if existing_row == row:
-                    print("Row already exists in the CSV file. Skipping writing.")
-                    return
-
-    # Write the row to the CSV file
-    with open(csv_file, mode='a', newline='') as file:
+    row = [proj_file] + [str(getattr(args, arg)) for arg in ARG_NAMES]
+
+    # Open the CSV file once: scan it for the row from the start, then append (a+ always writes at the end)
+    with open(csv_file, mode='a+', newline='') as file:
+        file.seek(0)
+        # Check if the row already exists in the CSV file
+        for existing_row in csv.reader(file):
+            if existing_row == row:
+                print("Row already exists in the CSV file. Skipping writing.")
+                return
+
+        # Write the row to the CSV file
         writer = csv.writer(file)
         if file.tell() == 0:
             writer.writerow(headers)  # Write headers if file is empty
@@ -852,144 +885,184 @@ def resume_proc():
 
 
 
+# GPU devices are enumerated once per Python process and the mask is reused for every project run in it
+_GPU_MASK = (1 << len(Metashape.app.enumGPUDevices())) - 1  # Set GPU mask for your device
+
+GEOID_PATH = r"M:\working_package_2\2024_dronecampaign\02_processing\geoid\ch_swisstopo_chgeo2004_ETRS89_LN02.tif"
+
 ############################################
 ##  Main code
 ############################################
-print("Script start")
-
-
-
-# Parse arguments and initialise variables
-parser = argparse.ArgumentParser(
-    description='Update camera positions in P1 and/or MicaSense chunks in Metashape project')
-parser.add_argument('-proj_path', help='path to Metashape project file', required=True)
-parser.add_argument('-date', help='Date of flight in YYYYMMDD format', required=True)
-parser.add_argument('-site', help='Site name', required=True)
-parser.add_argument('-crs',
-                    help='EPSG code for target projected CRS for micasense cameras. E.g: 7855 for GDA2020/MGA zone 55',
-                    required=True)
-parser.add_argument('-multispec', help='path to multispectral level0_raw folder with raw images')
-parser.add_argument('-rgb', help='path to RGB level0_raw folder that also has the MRK files')
-parser.add_argument('-smooth', help='Smoothing strength used to smooth RGB mesh low/med/high', default="low")
-parser.add_argument('-drtk', help='If RGB coordinates to be blockshifted, file containing \
+@dataclass(frozen=True)
+class Args:
+    """Arguments of one processing run, as parsed from the command line by parse_args"""
+    proj_path: str
+    date: str
+    site: str
+    crs: str
+    multispec: Optional[str] = None
+    rgb: Optional[str] = None
+    smooth: str = "low"
+    drtk: Optional[str] = None
+    sunsens: bool = False
+    test: bool = False
+    multionly: bool = False
+
+# Argument names in declaration order, used for the arguments log
+ARG_NAMES = tuple(field.name for field in fields(Args))
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments (argv defaults to sys.argv) into an Args instance"""
+    parser = argparse.ArgumentParser(
+        description='Update camera positions in P1 and/or MicaSense chunks in Metashape project')
+    parser.add_argument('-proj_path', help='path to Metashape project file', required=True)
+    parser.add_argument('-date', help='Date of flight in YYYYMMDD format', required=True)
+    parser.add_argument('-site', help='Site name', required=True)
+    parser.add_argument('-crs',
+                        help='EPSG code for target projected CRS for micasense cameras. E.g: 7855 for GDA2020/MGA zone 55',
+                        required=True)
+    parser.add_argument('-multispec', help='path to multispectral level0_raw folder with raw images')
+    parser.add_argument('-rgb', help='path to RGB level0_raw folder that also has the MRK files')
+    parser.add_argument('-smooth', help='Smoothing strength used to smooth RGB mesh low/med/high', default="low")
+    parser.add_argument('-drtk', help='If RGB coordinates to be blockshifted, file containing \
                                                   DRTK base station coordinates from field and AUSPOS', default=None)
-parser.add_argument('-sunsens', help='use sun sensor data for reflectance calibration', action='store_true')
-parser.add_argument('-test', help='make processing faster for debugging', action='store_true')
-parser.add_argument('-multionly', help='process multispec chunk only', action='store_true')
-
-global args
-args = parser.parse_args()
-
-# Initialize logging first
-setup_logging(args.proj_path)
-logging.info(f"Starting processing for project: {args.proj_path}")
-
-global MRK_PATH, MICASENSE_PATH
-
-global doc
-# Metashape project
-mask =  2 ** len(Metashape.app.enumGPUDevices()) - 1 # Set GPU mask for your device
-Metashape.app.gpu_mask = mask
-doc = Metashape.Document()
-proj_file = args.proj_path
-doc.open(proj_file, read_only=False)  # Open the document in editable mode
-
-doc.read_only= False
-
-if doc is None:
-    print("Error: Metashape document object is not initialized.")
-    sys.exit()
-
-if args.rgb:
-    MRK_PATH = args.rgb
-else:
-    # Default is relative to project location: ../rgb/level0_raw/
-    MRK_PATH = Path(proj_file).parents[1] / "rgb/level0_raw"
-    if not MRK_PATH.is_dir():
-        sys.exit("%s directory does not exist. Check and input paths using -rgb " % str(MRK_PATH))
+    parser.add_argument('-sunsens', help='use sun sensor data for reflectance calibration', action='store_true')
+    parser.add_argument('-test', help='make processing faster for debugging', action='store_true')
+    parser.add_argument('-multionly', help='process multispec chunk only', action='store_true')
+    return Args(**vars(parser.parse_args(argv)))
+
+
+def run_project(run_args):
+    """
+    Process the Metashape project given by run_args (an Args instance). All module-level state used by
+    proc_rgb/proc_multispec is (re)set here, so several projects can be run one after another in one process.
+    """
+    global args, doc, proj_file, PROJ_PARENT, PROJ_PARENTS1, PROJ_STEM, P1_CAM_CSV_WGS84, P1_CAM_CSV_CH1903, \
+        P1_CAM_CSV_blockshift, MICASENSE_CAM_CSV, MICASENSE_CAM_CSV_UPDATED, cam_model, MS_GIMBAL2_OFFSET, \
+        check_chunk_list, dict_chunks, MRK_PATH, MICASENSE_PATH, DRTK_TXT_FILE, quality1, quality2, quality3
+    args = run_args
+
+    # Initialize logging first
+    setup_logging(args.proj_path)
+    logging.info(f"Starting processing for project: {args.proj_path}")
+    logging.info(f"GeoTIFF exports use {TIFF_COMPRESSION_NAME} compression")
+
+    # Metashape project
+    Metashape.app.gpu_mask = _GPU_MASK
+    doc = Metashape.Document()
+    proj_file = args.proj_path
+
+    # Project location, derived once and reused for default data folders and output files
+    PROJ_PARENT = Path(proj_file).parent
+    PROJ_PARENTS1 = Path(proj_file).parents[1]
+    PROJ_STEM = Path(proj_file).stem
+    doc.open(proj_file, read_only=False)  # Open the document in editable mode
+
+    doc.read_only= False
+
+    if doc is None:
+        print("Error: Metashape document object is not initialized.")
+        sys.exit()
+
+    if args.rgb:
+        MRK_PATH = args.rgb
     else:
-        MRK_PATH = str(MRK_PATH)
+        # Default is relative to project location: ../rgb/level0_raw/
+        MRK_PATH = PROJ_PARENTS1 / "rgb/level0_raw"
+        if not MRK_PATH.is_dir():
+            sys.exit("%s directory does not exist. Check and input paths using -rgb " % str(MRK_PATH))
+        else:
+            MRK_PATH = str(MRK_PATH)
 
-# TODO update when other sensors are used
-if args.multispec:
-    MICASENSE_PATH = args.multispec
-else:
-    # Default is relative to project location: ../multispec/level0_raw/
-    MICASENSE_PATH = Path(proj_file).parents[1] / "multispec/level0_raw"
+    # TODO update when other sensors are used
+    if args.multispec:
+        MICASENSE_PATH = args.multispec
+    else:
+        # Default is relative to project location: ../multispec/level0_raw/
+        MICASENSE_PATH = PROJ_PARENTS1 / "multispec/level0_raw"
 
-    if not MICASENSE_PATH.is_dir():
-        sys.exit("%s directory does not exist. Check and input paths using -multispec " % str(MICASENSE_PATH))
+        if not MICASENSE_PATH.is_dir():
+            sys.exit("%s directory does not exist. Check and input paths using -multispec " % str(MICASENSE_PATH))
+        else:
+            MICASENSE_PATH = str(MICASENSE_PATH)
+
+    if args.drtk is not None:
+        DRTK_TXT_FILE = args.drtk
+        if not Path(DRTK_TXT_FILE).is_file():
+            sys.exit("%s file does not exist. Check and input correct path using -drtk option" % str(DRTK_TXT_FILE))
+
+    if args.smooth not in DICT_SMOOTH_STRENGTH:
+        sys.exit("Value for -smooth must be one of low, medium or high.")
+
+    # Set quality values for the downscale value in RGB and Multispec for testing
+    if args.test:
+        quality1 = 4 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
+        quality2 = 8 #ultra, high, medium, low, lowest: 1, 2, 4, 8, 16
+        quality3 = 2 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
+        print("Test mode enabled: quality1 set to 4, quality2 set to 8, quality3 set to 2")
     else:
-        MICASENSE_PATH = str(MICASENSE_PATH)
-
-if args.drtk is not None:
-    DRTK_TXT_FILE = args.drtk
-    if not Path(DRTK_TXT_FILE).is_file():
-        sys.exit("%s file does not exist. Check and input correct path using -drtk option" % str(DRTK_TXT_FILE))
-
-if args.smooth not in DICT_SMOOTH_STRENGTH:
-    sys.exit("Value for -smooth must be one of low, medium or high.")
-
-# Set quality values for the downscale value in RGB and Multispec for testing
-if args.test:
-    quality1 = 4 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
-    quality2 = 8 #ultra, high, medium, low, lowest: 1, 2, 4, 8, 16
-    quality3 = 2 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
-    print("Test mode enabled: quality1 set to 4, quality2 set to 8, quality3 set to 2")
-else:
-    quality1 = 1  #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
-    quality2 = 2  #ultra, high, medium, low, lowest: 1, 2, 4, 8, 16
-    quality3 = 0 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
-    print("Default mode: quality1 set to 1, quality2 set to 2, quality3 set to 0")
-
-# Export blockshifted P1 positions. Not used in script. Useful for debug or to restart parts of script following any issues.
-P1_CAM_CSV_WGS84 = Path(proj_file).parent / "p1_pos_WGS84.csv"
-P1_CAM_CSV_CH1903 = Path(proj_file).parent / "p1_pos_CH1903.csv"
-P1_CAM_CSV_blockshift = Path(proj_file).parent / "p1_pos_blockshift.csv"
-# By default save the CSV with updated MicaSense positions in the MicaSense folder. CSV used within script.
-MICASENSE_CAM_CSV = Path(proj_file).parent / "interpolated_micasense_pos.csv"
-MICASENSE_CAM_CSV_UPDATED = Path(proj_file).parent / "interpolated_micasense_pos_updated.csv"
-GEOID_PATH = r"M:\working_package_2\2024_dronecampaign\02_processing\geoid\ch_swisstopo_chgeo2004_ETRS89_LN02.tif"
-##################
-# Add images
-##################
-# If the multionli argument is not set, add images to the project
-
-
-# Check that lever-arm offsets are non-zero:
-# As this script is for RGB and MS images captured simultaneously on dual gimbal, lever-arm offsets cannot be 0.
-#  Zenmuse P1
-if P1_GIMBAL1_OFFSET == 0:
-    err_msg = "Lever-arm offset for P1 in dual gimbal mode cannot be 0. Update offset_dict and rerun_script."
-    Metashape.app.messageBox(err_msg)
-
-# MicaSense: get Camera Model from one of the images to check the lever-arm offsets for the relevant model
-micasense_images = find_files(MICASENSE_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
-sample_img = open(micasense_images[0], 'rb')
-exif_tags = exifread.process_file(sample_img)
-cam_model = str(exif_tags.get('Image Model'))
-
-# HARDCODED number of bands.
-# Dual sensor (RedEdge-MX Dual: 10, RedEdge-P Dual: 11)
-# Dual sensor: If offsets are 0, exit with error.
-MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Dual']
-
-
-# Used to find chunks in proc_*
-check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-dict_chunks = {}
-for get_chunk in doc.chunks:
-    dict_chunks.update({get_chunk.label: get_chunk.key})
-
-
-try:
-    # VERY IMPORTANT THE ACTUAL PROCESSING HAPPENS HERE
-    resume_proc()
-    logging.info("Processing completed successfully")
-except Exception as e:
-    logging.error(f"Processing failed: {str(e)}", exc_info=True)
-    raise  # Re-raise exception to trigger error in main script
-finally:
-    doc.save()
-    logging.info("Project saved")
-print("DONE WITH PROJ:", proj_file)
+        quality1 = 1  #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
+        quality2 = 2  #ultra, high, medium, low, lowest: 1, 2, 4, 8, 16
+        quality3 = 0 #highest, high, medium, low, lowest: 0, 1, 2, 4, 8
+        print("Default mode: quality1 set to 1, quality2 set to 2, quality3 set to 0")
+
+    # Export blockshifted P1 positions. Not used in script. Useful for debug or to restart parts of script following any issues.
+    P1_CAM_CSV_WGS84 = PROJ_PARENT / "p1_pos_WGS84.csv"
+    P1_CAM_CSV_CH1903 = PROJ_PARENT / "p1_pos_CH1903.csv"
+    P1_CAM_CSV_blockshift = PROJ_PARENT / "p1_pos_blockshift.csv"
+    # By default save the CSV with updated MicaSense positions in the MicaSense folder. CSV used within script.
+    MICASENSE_CAM_CSV = PROJ_PARENT / "interpolated_micasense_pos.csv"
+    MICASENSE_CAM_CSV_UPDATED = PROJ_PARENT / "interpolated_micasense_pos_updated.csv"
+    ##################
+    # Add images
+    ##################
+    # If the multionli argument is not set, add images to the project
+
+
+    # Check that lever-arm offsets are non-zero:
+    # As this script is for RGB and MS images captured simultaneously on dual gimbal, lever-arm offsets cannot be 0.
+    #  Zenmuse P1
+    if P1_GIMBAL1_OFFSET == 0:
+        err_msg = "Lever-arm offset for P1 in dual gimbal mode cannot be 0. Update offset_dict and rerun_script."
+        Metashape.app.messageBox(err_msg)
+
+    # MicaSense: get Camera Model from one of the images to check the lever-arm offsets for the relevant model
+    micasense_images = find_files(MICASENSE_PATH, (".jpg", ".jpeg", ".tif", ".tiff"))
+    # Only the model tag is needed: skip MakerNote/thumbnail parsing and stop once it is read.
+    # exifread matches stop_tag against the bare tag name, i.e. 'Model' for 'Image Model'.
+    with open(micasense_images[0], 'rb') as sample_img:
+        exif_tags = exifread.process_file(sample_img, details=False, stop_tag='Model', strict=False)
+    cam_model = str(exif_tags.get('Image Model'))
+
+    # HARDCODED number of bands.
+    # Dual sensor (RedEdge-MX Dual: 10, RedEdge-P Dual: 11)
+    # Dual sensor: If offsets are 0, exit with error.
+    MS_GIMBAL2_OFFSET = offset_dict[cam_model]['Dual']
+
+
+    # Used to find chunks in proc_*
+    check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
+    dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
+
+
+    processing_ok = False
+    try:
+        # VERY IMPORTANT THE ACTUAL PROCESSING HAPPENS HERE
+        resume_proc()
+        processing_ok = True
+        logging.info("Processing completed successfully")
+    except Exception as e:
+        logging.error(f"Processing failed: {str(e)}", exc_info=True)
+        raise  # Re-raise exception to trigger error in main script
+    finally:
+        # proc_multispec already saves the project as its last step; save here only if processing stopped early
+        if not processing_ok:
+            doc.save()
+            logging.info("Project saved")
+    print("DONE WITH PROJ:", proj_file)
+
+
+if __name__ == "__main__":
+    print("Script start")
+    run_project(parse_args())
@@ -1,48 +1,195 @@
 import csv
 import argparse
+import logging
+import logging.handlers
+import os
+import queue
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def main():
-    parser = argparse.ArgumentParser(description='Run metashape_proc_Upscale.py with arguments from a CSV file')
-    parser.add_argument('-csv', help='Path to the CSV file containing the arguments', required=True)
-    args = parser.parse_args()
+SCRIPT_PATH = r'C:\Users\admin\Documents\Python Scripts\drone_metashape\metashape_proc_Upscale.py'
+# Bytes read from the start of each image when prefetching, enough for the EXIF/XMP headers
+PREFETCH_BYTES = 1024 * 1024
 
-    # Function to filter out empty keys from the CSV row
-    def filter_empty_keys(row):
-        return {k: v for k, v in row.items() if k and v}
+# Consolidated log of all projects in a batch (see -batch_log). Worker threads only put records on a queue;
+# a single QueueListener thread writes them to the file.
+batch_log = logging.getLogger("multiprocess_from_csv.batch")
+batch_log.setLevel(logging.INFO)
+batch_log.propagate = False
 
-    # Loop through all lines in the CSV file and run the script with the arguments
-    with open(args.csv, mode='r') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            try:
-                filtered_row = filter_empty_keys(row)
-                print("Running metashape_proc_Upscale.py with the following arguments:")
-                command = [sys.executable, r'C:\Users\admin\Documents\Python Scripts\drone_metashape\metashape_proc_Upscale.py']
-                for key, value in filtered_row.items():
-                    command.append(f'-{key}')
-                    command.append(value)
-                    print(f"{key}: {value}")
-                # Print the full command to be run
-                print(f"Full command: {' '.join(command)}")
-                # Run the command
-                result = subprocess.run(command, capture_output=True, text=True)
-                # Print the result of the subprocess
-                print(f"Subprocess returned with code {result.returncode}")
-                if result.stdout:
-                    print(f"Subprocess output: {result.stdout}")
-                if result.stderr:
-                    print(f"Subprocess errors: {result.stderr}")
-            except Exception as e:
-                print(f"An error occurred: {e}")
-            
+
+def start_batch_log(path):
+    """Send batch_log records through a queue to a single file writer thread and return the started listener"""
+    log_queue = queue.Queue()
+    file_handler = logging.FileHandler(path, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    batch_log.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+
+# Function to filter out empty keys from the CSV row
+def filter_empty_keys(row):
+    return {k: v for k, v in row.items() if k and v}
+
+
+def build_command(row):
+    """Command line for metashape_proc_Upscale.py with the non-empty columns of a CSV row as arguments"""
+    command = [sys.executable, SCRIPT_PATH]
+    for key, value in filter_empty_keys(row).items():
+        command.append(f'-{key}')
+        command.append(value)
+    return command
+
+
+def prefetch_folders(row):
+    """
+    Warm the OS file cache for the rgb and multispec folders of a CSV row: walk them with os.scandir and read the
+    first PREFETCH_BYTES of every file (posix_fadvise WILLNEED where available). Images are not decoded.
+    Errors are ignored, prefetching is only an optimisation.
+    """
+    fadvise = getattr(os, 'posix_fadvise', None)
+    buffer = bytearray(PREFETCH_BYTES)
+    stack = [row[key] for key in ('rgb', 'multispec') if row.get(key)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        with open(entry.path, 'rb', buffering=0) as f:
+                            if fadvise is not None:
+                                fadvise(f.fileno(), 0, PREFETCH_BYTES, os.POSIX_FADV_WILLNEED)
+                            else:
+                                f.readinto(buffer)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def run_one(row, free_gpus=None, prefix='', log_dir=None):
+    """
+    Run metashape_proc_Upscale.py for one CSV row, streaming its output line by line, and return a one-line summary.
+    Output lines are written with prefix (used to tell concurrent projects apart) and, if log_dir is given, also
+    to <log_dir>/<project name>.log. All lines also go to batch_log when -batch_log is set.
+    If free_gpus is given, one GPU index is taken from it for the duration of the run and passed as -gpu_mask,
+    so concurrent Metashape processes do not share a device.
+    """
+    command = build_command(row)
+    gpu = None
+    if free_gpus is not None and not row.get('gpu_mask'):
+        gpu = free_gpus.get()
+        command += ['-gpu_mask', str(1 << gpu)]
+    log_file = None
+    try:
+        lines = ["Running metashape_proc_Upscale.py with the following arguments:"]
+        lines += [f"{key}: {value}" for key, value in filter_empty_keys(row).items()]
+        # Print the full command to be run
+        lines.append(f"Full command: {' '.join(command)}")
+        sys.stdout.write("".join(f"{prefix}{line}\n" for line in lines))
+        use_batch_log = bool(batch_log.handlers)
+        if use_batch_log:
+            batch_log.info("%s%s", prefix, lines[-1])
+
+        if log_dir is not None:
+            name = os.path.splitext(os.path.basename(row.get('proj_path') or 'project'))[0]
+            log_file = open(os.path.join(log_dir, name + ".log"), 'w', encoding='utf-8')
+        # Run the command; stderr is merged into stdout so OUTPUT_* lines and errors appear as they happen
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, text=True)
+        for line in proc.stdout:
+            sys.stdout.write(prefix + line)
+            if log_file is not None:
+                log_file.write(line)
+            if use_batch_log:
+                batch_log.info("%s%s", prefix, line.rstrip("\n"))
+        proc.wait()
+        summary = f"{prefix}Subprocess returned with code {proc.returncode}"
+    except Exception as e:
+        summary = f"{prefix}An error occurred: {e}"
+    finally:
+        if log_file is not None:
+            log_file.close()
+        if gpu is not None:
+            free_gpus.put(gpu)
+    if batch_log.handlers:
+        batch_log.info("%s", summary)
+    return summary
+
+
+def run_batch(rows, args):
+    """Run all CSV rows, one by one or with args.workers concurrent jobs"""
+    if args.interactive or args.workers <= 1:
+        # Loop through all lines in the CSV file and run the script with the arguments.
+        # While a project runs, the image folders of the next one are read ahead in a background thread.
+        prefetcher = None
+        for i, row in enumerate(rows):
+            if prefetcher is not None:
+                prefetcher.join()
+                prefetcher = None
+            if args.prefetch and i + 1 < len(rows):
+                prefetcher = threading.Thread(target=prefetch_folders, args=(rows[i + 1],), daemon=True)
+                prefetcher.start()
+            print(run_one(row, log_dir=args.log_dir))
+            if not args.interactive:
+                continue
             # Prompt the user to check the results before proceeding
             try:
                 input("Press Enter to proceed to the next iteration...")
             except KeyboardInterrupt:
                 print("Process interrupted by user.")
                 sys.exit(0)
+        return
+
+    # Metashape does the heavy lifting in its own process, so threads are enough to keep several runs going
+    free_gpus = None
+    if args.gpus > 0:
+        free_gpus = queue.Queue()
+        for gpu in range(args.gpus):
+            free_gpus.put(gpu)
+    workers = min(args.workers, args.gpus) if args.gpus > 0 else args.workers
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_one, row, free_gpus, f"[{i + 1}/{len(rows)}] ", args.log_dir)
+                   for i, row in enumerate(rows)]
+        for future in as_completed(futures):
+            print(future.result())
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run metashape_proc_Upscale.py with arguments from a CSV file')
+    parser.add_argument('-csv', help='Path to the CSV file containing the arguments', required=True)
+    parser.add_argument('-workers', type=int, default=1,
+                        help='Number of projects processed at the same time. Default: 1')
+    parser.add_argument('-gpus', type=int, default=0,
+                        help='Number of GPUs to spread concurrent projects over, one GPU per project. '
+                             'Default: 0 (each project uses all GPUs)')
+    parser.add_argument('-interactive', action='store_true',
+                        help='Process projects one by one and wait for Enter after each')
+    parser.add_argument('-no_prefetch', dest='prefetch', action='store_false',
+                        help='Do not read ahead the image folders of the next project while one is running')
+    parser.add_argument('-log_dir', help='Also write the output of each project to <log_dir>/<project name>.log')
+    parser.add_argument('-batch_log', help='Also write the output of all projects to this single log file')
+    args = parser.parse_args()
+
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    with open(args.csv, mode='r') as file:
+        rows = list(csv.DictReader(file))
+
+    listener = start_batch_log(args.batch_log) if args.batch_log else None
+    try:
+        run_batch(rows, args)
+    finally:
+        if listener is not None:
+            listener.stop()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
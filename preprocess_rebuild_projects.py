@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Run the Metashape-independent preprocessing for all projects in projects_to_rebuild.csv in parallel.
+
+For each project the MicaSense images are listed and the MicaSense positions are interpolated from the P1 MRK
+files into interpolated_micasense_pos.preprocessed.csv next to the project file, with the same
+upd_micasense_pos_original module as loadprocess_multispec.py. The inputs (crs, master band suffix, MRK and
+MicaSense folders and their modification times) are stored next to it in interpolated_micasense_pos.preprocessed.json.
+proc_multispec in loadprocess_multispec.py reuses the CSV only if these match its own inputs, so the interpolation
+is not repeated when the projects are then processed serially in Metashape.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+from pathlib import Path
+
+import numpy as np
+
+import upd_micasense_pos_original
+
+IMG_EXTENSIONS = frozenset({'jpg', 'jpeg', 'tif', 'tiff'})
+# Kept apart from interpolated_micasense_pos.csv, which the processing scripts write themselves
+PREPROCESSED_CAM_CSV = "interpolated_micasense_pos.preprocessed.csv"
+PREPROCESSED_INFO = "interpolated_micasense_pos.preprocessed.json"
+
+
+def find_files(folder, types):
+    """
+    Return paths of all files under folder whose lowercase extension (without the dot) is in the set types.
+    Directories are walked with os.scandir using an explicit stack; symlinked directories are not followed.
+    """
+    photo_list = list()
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    _, dot, ext = entry.name.rpartition('.')
+                    if dot and ext.lower() in types:
+                        photo_list.append(entry.path)
+    return photo_list
+
+
+def master_band_suffix(images):
+    """
+    Return the file suffix of the MicaSense master band images (naming IMG_xxxx_suffixNum), i.e. the lowest band
+    number found, or None if no image follows the naming.
+    """
+    suffixes = {Path(image).stem.rpartition('_')[2] for image in images}
+    band_numbers = [suffix for suffix in suffixes if suffix.isdigit()]
+    return min(band_numbers, key=int) if band_numbers else None
+
+
+def preprocess_inputs(crs, image_suffix, mrk_folder, micasense_folder):
+    """
+    Return the inputs an interpolated positions CSV depends on, as stored in PREPROCESSED_INFO. The folder
+    modification times change when images or MRK files are added or removed.
+    """
+    return {
+        'crs': str(crs),
+        'image_suffix': str(image_suffix),
+        'mrk_folder': os.path.normcase(os.path.abspath(mrk_folder)),
+        'mrk_mtime_ns': os.stat(mrk_folder).st_mtime_ns,
+        'micasense_folder': os.path.normcase(os.path.abspath(micasense_folder)),
+        'micasense_mtime_ns': os.stat(micasense_folder).st_mtime_ns,
+    }
+
+
+def preprocessed_cam_csv(proj_dir, crs, image_suffix, mrk_folder, micasense_folder):
+    """
+    Return the path of the preprocessed positions CSV in proj_dir if it was computed from exactly these inputs,
+    otherwise None.
+    """
+    csv_file = Path(proj_dir) / PREPROCESSED_CAM_CSV
+    try:
+        info = json.loads((Path(proj_dir) / PREPROCESSED_INFO).read_text(encoding='utf-8'))
+        current = preprocess_inputs(crs, image_suffix, mrk_folder, micasense_folder)
+    except (OSError, ValueError):
+        return None
+    if info == current and csv_file.is_file():
+        return csv_file
+    return None
+
+
+def preprocess_one(task):
+    """
+    Preprocess a single project row. Returns (project_path, status).
+    crs and image_suffix are used when the row has no crs column or the suffix cannot be derived from the images.
+    """
+    project_row, crs, image_suffix = task
+    project_path = project_row['project_path']
+    try:
+        micasense_images = find_files(project_row['multispec'], IMG_EXTENSIONS)
+        if not micasense_images:
+            return project_path, "error: no MicaSense images found"
+
+        crs = project_row.get('crs') or crs
+        image_suffix = image_suffix or master_band_suffix(micasense_images)
+        if image_suffix is None:
+            return project_path, "error: could not derive the master band suffix from the image names"
+
+        proj_dir = Path(project_path).parent
+        proj_dir.mkdir(parents=True, exist_ok=True)
+        info_file = proj_dir / PREPROCESSED_INFO
+        # Invalidate first, so an interrupted run never leaves a CSV that looks current
+        info_file.unlink(missing_ok=True)
+        upd_micasense_pos_original.ret_micasense_pos(project_row['rgb'], project_row['multispec'], image_suffix,
+                                                     crs, str(proj_dir / PREPROCESSED_CAM_CSV),
+                                                     np.array([0.0, 0.0, 0.0]))
+        info = preprocess_inputs(crs, image_suffix, project_row['rgb'], project_row['multispec'])
+        info_file.write_text(json.dumps(info, indent=2), encoding='utf-8')
+        return project_path, f"ok (suffix {image_suffix}, EPSG {crs}, {len(micasense_images)} images)"
+    except Exception as e:
+        return project_path, f"error: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Interpolate MicaSense positions for projects to rebuild in parallel')
+    parser.add_argument('-csv', help='CSV with projects to rebuild', default='projects_to_rebuild.csv')
+    parser.add_argument('-crs', help='EPSG code for target projected CRS, used for rows without a crs column',
+                        default='2056')
+    parser.add_argument('-suffix', help='File suffix of MicaSense master band images. '
+                                        'Default: lowest band number in the image names of each project')
+    parser.add_argument('-processes', type=int, help='Number of worker processes',
+                        default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+
+    with open(args.csv, mode='r', newline='', encoding='utf-8') as file:
+        tasks = [(row, args.crs, args.suffix) for row in csv.DictReader(file)]
+
+    # upd_micasense_pos_original keeps P1 events in module globals, so every project gets a fresh worker process
+    with multiprocessing.Pool(processes=args.processes, maxtasksperchild=1) as pool:
+        results = pool.map(preprocess_one, tasks)
+
+    for project_path, status in results:
+        print(f"{project_path}: {status}")
+
+
+if __name__ == "__main__":
+    main()
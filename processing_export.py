@@ -19,7 +19,10 @@ import importlib
 import upd_micasense_pos
 from metashape_proc_tern import proc_rgb, proc_multispec
 
-importlib.reload(upd_micasense_pos)
+# Pick up edits to upd_micasense_pos when re-running from the Metashape console during development
+if os.environ.get('DEV_RELOAD'):
+    importlib.reload(upd_micasense_pos)
+    from upd_micasense_pos import ret_micasense_pos
 
 # Constants
 GEOG_COORD = collections.namedtuple('Geog_CS', ['lat_decdeg', 'lon_decdeg', 'elliph'])
@@ -51,11 +54,13 @@ def main():
 
     doc = Metashape.app.document
     proj_file = doc.path
+    proj_dir = Path(proj_file).parent
+    proj_parents1 = Path(proj_file).parents[1]
 
     if args.rgb:
         MRK_PATH = args.rgb
     else:
-        MRK_PATH = Path(proj_file).parents[1] / "rgb/level0_raw"
+        MRK_PATH = proj_parents1 / "rgb/level0_raw"
         if not MRK_PATH.is_dir():
             sys.exit("%s directory does not exist. Check and input paths using -rgb " % str(MRK_PATH))
         else:
@@ -64,7 +69,7 @@ def main():
     if args.multispec:
         MICASENSE_PATH = args.multispec
     else:
-        MICASENSE_PATH = Path(proj_file).parents[1] / "multispec/level0_raw"
+        MICASENSE_PATH = proj_parents1 / "multispec/level0_raw"
         if not MICASENSE_PATH.is_dir():
             sys.exit("%s directory does not exist. Check and input paths using -multispec " % str(MICASENSE_PATH))
         else:
@@ -78,13 +83,11 @@ def main():
     if args.smooth not in DICT_SMOOTH_STRENGTH:
         sys.exit("Value for -smooth must be one of low, medium or high.")
 
-    P1_CAM_CSV = Path(proj_file).parent / "dbg_shifted_p1_pos.csv"
-    MICASENSE_CAM_CSV = Path(proj_file).parent / "interpolated_micasense_pos.csv"
+    P1_CAM_CSV = proj_dir / "dbg_shifted_p1_pos.csv"
+    MICASENSE_CAM_CSV = proj_dir / "interpolated_micasense_pos.csv"
 
     check_chunk_list = [CHUNK_RGB, CHUNK_MULTISPEC]
-    dict_chunks = {}
-    for get_chunk in doc.chunks:
-        dict_chunks.update({get_chunk.label: get_chunk.key})
+    dict_chunks = {get_chunk.label: get_chunk.key for get_chunk in doc.chunks}
 
     proc_rgb()
     proc_multispec()
@@ -25,11 +25,21 @@ import Metashape
 
 # ---------- Added from metashape_proc_Upscale ----------
 def find_files(folder: Path, extensions: Tuple[str]) -> List[str]:
-    """Recursively find files with specified extensions."""
-    return [
-        str(p) for p in folder.rglob("*")
-        if p.suffix.lower() in extensions and p.is_file()
-    ]
+    """Recursively find files with specified extensions (os.scandir walk, symlinked directories not followed)."""
+    # Lowercase extensions without the dot, looked up in a set against the text after the last dot of each name
+    ext_set = frozenset(e.lstrip('.').lower() for e in extensions)
+    found = []
+    stack = [os.fspath(folder)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    _, dot, ext = entry.name.rpartition('.')
+                    if dot and ext.lower() in ext_set:
+                        found.append(entry.path)
+    return found
 
 # Define Metashape project directory
 proj_directory = Path(r"M:\working_package_2\2024_dronecampaign\02_processing\metashape_projects\Upscale_Metashapeprojects")
@@ -118,27 +128,29 @@ SITE_MAPPING = {
     }
 }
 
+# Case-insensitive lookup of the site folder name by the site name used in the CSV
+_SITE_FOLDER_BY_NAME = {mapping["image_site_name"].casefold(): mapping["folder_name"]
+                        for mapping in SITE_MAPPING.values()}
+
 def find_site_folder(root_dir: Path, csv_site_name: str) -> Optional[Path]:
     """
     Finds the existing site folder within the root directory using the SITE_MAPPING.
     """
-    for mapping in SITE_MAPPING.values():
-        if csv_site_name.lower() == mapping["image_site_name"].lower():
-            folder_path = root_dir / mapping["folder_name"]
-            if folder_path.is_dir():
-                return folder_path
-            break
-    return None
+    folder_name = _SITE_FOLDER_BY_NAME.get(csv_site_name.casefold())
+    if folder_name is None:
+        return None
+    folder_path = root_dir / folder_name
+    return folder_path if folder_path.is_dir() else None
 
-def process_projects(input_csv, output_csv):
+def process_projects(rows, output_csv):
     """
-    Processes projects from the input CSV and writes results to the output CSV.
+    Processes projects from the rows (dicts) of the input CSV and writes results to the output CSV.
+    Each result row is written and flushed as soon as its project is done, so a crash keeps the rows so far.
     """
-    all_results = []  # Store results in a list
-
-    with open(input_csv, 'r', newline='', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
-        for row in reader:
+    with open(output_csv, 'w', newline='', encoding='utf-8') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['date', 'site', 'rgb', 'multispec', 'sunsens', 'project_path', 'image_load_status'])
+        for row in rows:
             # Extract required columns
             date_str = row['date']
             site_name_from_csv = row['site']
@@ -155,7 +167,8 @@ def process_projects(input_csv, output_csv):
                     date_str, site_name_from_csv, str(rgb_path), str(multispec_path), sunsens,
                     'N/A', 'skipped (site folder not found - mapping)'
                 ]
-                all_results.append(result)
+                writer.writerow(result)
+                outfile.flush()
                 continue
 
             # Define project path within the found site folder
@@ -190,13 +203,9 @@ def process_projects(input_csv, output_csv):
                 result[6] = f'error: {str(e)}'
 
             finally:
-                all_results.append(result)  # Store the result
-
-    # Write all results to the output CSV at the end
-    with open(output_csv, 'w', newline='', encoding='utf-8') as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(['date', 'site', 'rgb', 'multispec', 'sunsens', 'project_path', 'image_load_status'])
-        writer.writerows(all_results)
+                # Creating a project takes far longer than a write, so flushing every row costs nothing
+                writer.writerow(result)
+                outfile.flush()
 
 def add_images_to_project(doc, rgb_path, multispec_path, proj_file):
     """
@@ -250,7 +259,7 @@ def add_images_to_project(doc, rgb_path, multispec_path, proj_file):
 
     # Check MicaSense configuration
     with open(micasense_images[0], 'rb') as f:
-        exif_tags = exifread.process_file(f)
+        exif_tags = exifread.process_file(f, details=False, stop_tag='Model', strict=False)
         cam_model = str(exif_tags.get('Image Model', 'UNKNOWN'))
 
     sensor_config = 'Dual' if len(multispec_chunk.sensors) >= 10 else 'Red'
@@ -273,43 +282,34 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Process drone imagery in Metashape')
     parser.add_argument('input_csv', help='Input CSV file with project parameters')
+    parser.add_argument('-verbose', action='store_true', help='Print the site mapping and project folder of each row')
     args = parser.parse_args()
 
     # Generate output path automatically
     input_path = Path(args.input_csv)
     output_csv = proj_directory / (input_path.stem + "_project_created.csv")
 
-    #process_projects(args.input_csv, str(output_csv))
-
     # Debugging: Print the input CSV path and output CSV path
     print(f"Input CSV: {args.input_csv}")
     print(f"Output CSV: {output_csv}")
 
-    # Debugging: Check if the mapping works for each site in the input CSV
+    # Read the input CSV once; the same rows are used for the debug output and the processing
     with open(args.input_csv, 'r', newline='', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
-        for row in reader:
-            site_name_from_csv = row['site']
-            site_folder = find_site_folder(root_site_directory, site_name_from_csv)
-            if site_folder:
-                print(f"Mapping successful for site '{site_name_from_csv}': {site_folder.name}")
-            else:
-                print(f"Mapping failed for site '{site_name_from_csv}'")
+        rows = list(csv.DictReader(infile))
 
-    # Debugging: Print the folder structure for each site and date
-    with open(args.input_csv, 'r', newline='', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
-        for row in reader:
+    # Debugging: Check if the mapping works for each site in the input CSV and print the resulting folder structure
+    if args.verbose:
+        for row in rows:
             site_name_from_csv = row['site']
             date_str = row['date']
             site_folder = find_site_folder(root_site_directory, site_name_from_csv)
             if site_folder:
                 project_folder = site_folder / date_str
+                print(f"Mapping successful for site '{site_name_from_csv}': {site_folder.name}")
                 print(f"Site folder: {site_folder}")
                 print(f"Date folder: {project_folder}")
                 print(f"Project folder: {project_folder / f'metashape_project_{site_folder.name}_{date_str}.psx'}")
             else:
                 print(f"Mapping failed for site '{site_name_from_csv}'")
 
-
-    process_projects(args.input_csv, str(output_csv))
\ No newline at end of file
+    process_projects(rows, str(output_csv))
@@ -15,8 +15,9 @@ import argparse
 import csv
 import os
 from pathlib import Path
-from collections import defaultdict
-from typing import List, Tuple, Optional, Dict
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import logging
 
 # Set up logging
@@ -38,15 +39,47 @@ except ImportError:
     logger.warning("exifread module not available. EXIF validation will be skipped.")
 
 
+# Spaces and hyphens in site names become underscores
+_SITE_TRANS = str.maketrans({' ': '_', '-': '_'})
+
+
+@lru_cache(maxsize=None)
+def _sanitize_site(site_name: str) -> str:
+    """Site name for comparisons and folder/file names: lowercase, spaces and hyphens replaced by underscores."""
+    return site_name.translate(_SITE_TRANS).lower()
+
+
 # ---------- Added from metashape_proc_Upscale ----------
+def _scandir_recursive(path: str) -> Iterator[os.DirEntry]:
+    """Yield the file entries below path, using the file types cached by os.scandir. Symlinks are skipped."""
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_symlink():
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scandir_recursive(entry.path)
+            else:
+                yield entry
+
+
 def find_files(folder: Path, extensions: Tuple[str]) -> List[str]:
     """Recursively find files with specified extensions."""
+    ext_set = frozenset(ext.lstrip('.').lower() for ext in extensions)
     return [
-        str(p) for p in folder.rglob("*")
-        if p.suffix.lower() in extensions and p.is_file()
+        entry.path for entry in _scandir_recursive(os.fspath(folder))
+        if entry.name.rpartition('.')[1] and entry.name.rpartition('.')[2].lower() in ext_set
     ]
 
 
+@lru_cache(maxsize=64)
+def _camera_model_for_dir(first_image_path: str) -> str:
+    """Camera model from the EXIF of the first image of a folder, parsed once per image path."""
+    with open(first_image_path, 'rb') as f:
+        # Stop after the Image Model tag and skip maker notes and thumbnails
+        exif_tags = exifread.process_file(f, details=False, stop_tag='Model', strict=False)
+    return str(exif_tags.get('Image Model', 'UNKNOWN'))
+
+
 class RobustProjectCreator:
     """
     A robust project creator that can handle various naming mismatches
@@ -64,6 +97,24 @@ class RobustProjectCreator:
         self.available_multispec_folders = self._get_available_folders(base_multispec_path)
         self.available_project_folders = self._get_available_folders(project_base_path)
         
+        # (base path, set of available folders) per path type
+        self._base_info: Dict[str, Tuple[Path, Set[str]]] = {
+            'rgb': (self.base_rgb_path, set(self.available_rgb_folders)),
+            'multispec': (self.base_multispec_path, set(self.available_multispec_folders)),
+            'project': (self.project_base_path, set(self.available_project_folders))
+        }
+        
+        # Fuzzy match indexes per path type, built once instead of scanning the folders for every CSV row
+        self._fuzzy_index = {
+            'rgb': self._build_fuzzy_index(self.available_rgb_folders),
+            'multispec': self._build_fuzzy_index(self.available_multispec_folders),
+            'project': self._build_fuzzy_index(self.available_project_folders)
+        }
+        
+        # Results of _resolve_folder and _path_exists
+        self._folder_cache: Dict[Tuple[str, str], Optional[Tuple[Path, Optional[str], Optional[str]]]] = {}
+        self._exists_cache: Dict[Path, bool] = {}
+        
         # Define comprehensive site name mappings
         self.site_mappings = self._create_comprehensive_site_mappings()
         
@@ -87,7 +138,8 @@ class RobustProjectCreator:
     def _get_available_folders(self, base_path: Path) -> List[str]:
         """Get list of available folders in the base path."""
         try:
-            return [f.name for f in base_path.iterdir() if f.is_dir()]
+            with os.scandir(base_path) as entries:
+                return [e.name for e in entries if e.is_dir(follow_symlinks=False)]
         except (FileNotFoundError, PermissionError) as e:
             logger.warning(f"Could not read {base_path}: {e}")
             return []
@@ -213,37 +265,90 @@ class RobustProjectCreator:
         }
         return mappings
     
-    def _normalize_site_name(self, site_name: str) -> str:
+    @staticmethod
+    def _normalize_site_name(site_name: str) -> str:
         """Normalize site name for comparison (lowercase, no spaces, etc.)"""
-        return site_name.lower().replace(' ', '_').replace('-', '_')
+        return _sanitize_site(site_name)
     
-    def _find_fuzzy_match(self, target: str, available_folders: List[str]) -> Optional[str]:
+    def _build_fuzzy_index(self, folders: List[str]) -> Tuple[List[Tuple[str, str]], Dict[str, str], Dict[str, Tuple[int, str]]]:
         """
-        Find a fuzzy match for the target in the available folders.
+        Index folder names for _find_fuzzy_match. Returns the (normalized name, folder) pairs, a map from
+        normalized name to folder and a map from each word longer than 2 characters to the (position, folder)
+        of the first folder containing it. The first folder wins on duplicates, as in a linear scan.
+        """
+        norm_folders = [(self._normalize_site_name(n), n) for n in folders]
+        exact_index = {}
+        word_index = {}
+        for position, (folder_norm, folder) in enumerate(norm_folders):
+            exact_index.setdefault(folder_norm, folder)
+            for word in folder_norm.split('_'):
+                if len(word) > 2:
+                    word_index.setdefault(word, (position, folder))
+        return norm_folders, exact_index, word_index
+    
+    def _find_fuzzy_match(self, target: str, fuzzy_index) -> Optional[str]:
+        """
+        Find a fuzzy match for the target in the available folders indexed by _build_fuzzy_index.
         Uses various matching strategies.
         """
+        norm_folders, exact_index, word_index = fuzzy_index
         target_norm = self._normalize_site_name(target)
         
         # First try exact match
-        for folder in available_folders:
-            if self._normalize_site_name(folder) == target_norm:
-                return folder
+        folder = exact_index.get(target_norm)
+        if folder is not None:
+            return folder
         
         # Try partial matches
-        for folder in available_folders:
-            folder_norm = self._normalize_site_name(folder)
+        for folder_norm, folder in norm_folders:
             if target_norm in folder_norm or folder_norm in target_norm:
                 return folder
         
-        # Try word-based matching
-        target_words = target_norm.split('_')
-        for folder in available_folders:
-            folder_words = self._normalize_site_name(folder).split('_')
-            if any(word in folder_words for word in target_words if len(word) > 2):
-                return folder
+        # Try word-based matching, taking the first folder that shares a word with the target
+        matches = [word_index[word] for word in target_norm.split('_') if word in word_index]
+        if matches:
+            return min(matches)[1]
         
         return None
     
+    def _resolve_folder(self, site_name: str, path_type: str) -> Optional[Tuple[Path, Optional[str], Optional[str]]]:
+        """
+        Return (base path, mapped folder, fuzzy matched folder) for a site, or None for an unknown path type.
+        The folders do not depend on the date, so the result is kept in self._folder_cache across CSV rows;
+        either folder is None if there is no candidate.
+        """
+        key = (site_name, path_type)
+        if key not in self._folder_cache:
+            self._folder_cache[key] = self._match_folder(site_name, path_type)
+        return self._folder_cache[key]
+    
+    def _match_folder(self, site_name: str, path_type: str) -> Optional[Tuple[Path, Optional[str], Optional[str]]]:
+        """Uncached _resolve_folder."""
+        base_info = self._base_info.get(path_type)
+        if base_info is None:
+            return None
+        base_path, available_folders = base_info
+        
+        target_folder = None
+        if site_name in self.site_mappings:
+            target_folder = self.site_mappings[site_name][path_type]
+            # Check if the mapped folder exists
+            if target_folder not in available_folders:
+                target_folder = None
+            elif path_type == "project":
+                # Project paths need not exist yet, so the mapped folder is always used
+                return base_path, target_folder, None
+        
+        fuzzy_match = self._find_fuzzy_match(site_name, self._fuzzy_index[path_type])
+        return base_path, target_folder, fuzzy_match
+    
+    def _path_exists(self, path: Path) -> bool:
+        """Path.exists(), remembered so the same date folder is only checked once."""
+        exists = self._exists_cache.get(path)
+        if exists is None:
+            exists = self._exists_cache[path] = path.exists()
+        return exists
+    
     def resolve_path(self, site_name: str, date_str: str, path_type: str, custom_project_dir: str = None) -> Optional[Path]:
         """
         Resolve the correct path for a given site, date, and path type.
@@ -263,58 +368,28 @@ class RobustProjectCreator:
             return self.project_base_path / custom_project_dir / date_str
         
         # Standard mode or RGB/multispec paths - use existing logic
+        resolved = self._resolve_folder(site_name, path_type)
+        if resolved is None:
+            return None
+        base_path, target_folder, fuzzy_match = resolved
+        
         # First try direct mapping
-        if site_name in self.site_mappings:
-            target_folder = self.site_mappings[site_name][path_type]
-            
-            if path_type == "rgb":
-                base_path = self.base_rgb_path
-                available_folders = self.available_rgb_folders
-            elif path_type == "multispec":
-                base_path = self.base_multispec_path
-                available_folders = self.available_multispec_folders
-            elif path_type == "project":
-                base_path = self.project_base_path
-                available_folders = self.available_project_folders
-            else:
-                return None
-            
-            # Check if the mapped folder exists
-            if target_folder in available_folders:
-                if path_type == "project":
-                    return base_path / target_folder / date_str
-                else:
-                    candidate_path = base_path / target_folder / date_str
-                    if candidate_path.exists():
-                        return candidate_path
+        if target_folder is not None:
+            candidate_path = base_path / target_folder / date_str
+            if path_type == "project" or self._path_exists(candidate_path):
+                return candidate_path
         
         # If direct mapping fails or in extra mode, try fuzzy matching
-        if path_type == "rgb":
-            base_path = self.base_rgb_path
-            available_folders = self.available_rgb_folders
-        elif path_type == "multispec":
-            base_path = self.base_multispec_path
-            available_folders = self.available_multispec_folders
-        elif path_type == "project":
-            base_path = self.project_base_path
-            available_folders = self.available_project_folders
-        else:
-            return None
-        
-        fuzzy_match = self._find_fuzzy_match(site_name, available_folders)
         if fuzzy_match:
             logger.info(f"Found fuzzy match for {site_name} ({path_type}): {fuzzy_match}")
-            if path_type == "project":
-                return base_path / fuzzy_match / date_str
-            else:
-                candidate_path = base_path / fuzzy_match / date_str
-                if candidate_path.exists():
-                    return candidate_path
+            candidate_path = base_path / fuzzy_match / date_str
+            if path_type == "project" or self._path_exists(candidate_path):
+                return candidate_path
         
         # In extra mode, for project paths, create a default project directory based on site name
         if self.extra_mode and path_type == "project":
             # Sanitize site name for use as directory name
-            sanitized_site = site_name.replace(' ', '_').replace('-', '_').lower()
+            sanitized_site = _sanitize_site(site_name)
             default_project_dir = f"{sanitized_site}_project"
             logger.info(f"Extra mode: Creating default project directory '{default_project_dir}' for site '{site_name}'")
             return base_path / default_project_dir / date_str
@@ -378,9 +453,7 @@ class RobustProjectCreator:
 
         # Check MicaSense configuration (only if exifread is available)
         if EXIFREAD_AVAILABLE:
-            with open(micasense_images[0], 'rb') as f:
-                exif_tags = exifread.process_file(f)
-                cam_model = str(exif_tags.get('Image Model', 'UNKNOWN'))
+            cam_model = _camera_model_for_dir(micasense_images[0])
 
             sensor_config = 'Dual' if len(multispec_chunk.sensors) >= 10 else 'Red'
             if self.offset_dict.get(cam_model, {}).get(sensor_config) == (0, 0, 0):
@@ -403,13 +476,21 @@ class RobustProjectCreator:
             output_csv: Path to output CSV file
             dry_run: If True, only validate paths without creating projects
         """
-        results = []
-        
         if not METASHAPE_AVAILABLE and not dry_run:
             logger.error("Metashape not available. Use --dry-run for validation only.")
             return
         
-        with open(input_csv, 'r', newline='', encoding='utf-8-sig') as infile:
+        output_fieldnames = ['date', 'site', 'rgb', 'multispec', 'sunsens', 'project_path', 'image_load_status']
+        # Add custom_project_dir column for extra mode
+        if self.extra_mode:
+            output_fieldnames.insert(-1, 'custom_project_dir')  # Insert before image_load_status
+        status_counts = Counter()
+        
+        # Results are written row by row as they are processed, so the output can be followed while it runs
+        with open(input_csv, 'r', newline='', encoding='utf-8-sig') as infile, \
+                open(output_csv, 'w', newline='', encoding='utf-8') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=output_fieldnames)
+            writer.writeheader()
             reader = csv.DictReader(infile)
             
             # Debug: Print available columns
@@ -461,7 +542,7 @@ class RobustProjectCreator:
                 if project_dir:
                     # In extra mode, use site name for project file naming if no custom dir specified
                     if self.extra_mode and not custom_project_dir:
-                        sanitized_site = site_name.replace(' ', '_').replace('-', '_').lower()
+                        sanitized_site = _sanitize_site(site_name)
                         project_file = project_dir / f"metashape_project_{sanitized_site}_{date_str}.psx"
                     elif self.extra_mode and custom_project_dir:
                         project_file = project_dir / f"metashape_project_{custom_project_dir}_{date_str}.psx"
@@ -519,7 +600,9 @@ class RobustProjectCreator:
                     logger.error(f"Error processing {site_name}/{date_str}: {str(e)}")
                     result['image_load_status'] = f"error: {str(e)}"
                 
-                results.append(result)
+                writer.writerow(result)
+                outfile.flush()
+                status_counts[result['image_load_status']] += 1
                 
                 # Log path corrections
                 if rgb_path and str(rgb_path) != original_rgb:
@@ -527,32 +610,9 @@ class RobustProjectCreator:
                 if multispec_path and str(multispec_path) != original_multispec:
                     logger.info(f"  Multispec path corrected: {original_multispec} -> {multispec_path}")
         
-        # Write results to output CSV
-        with open(output_csv, 'w', newline='', encoding='utf-8') as outfile:
-            fieldnames = ['date', 'site', 'rgb', 'multispec', 'sunsens', 'project_path', 'image_load_status']
-            # Add custom_project_dir column for extra mode
-            if self.extra_mode:
-                fieldnames.insert(-1, 'custom_project_dir')  # Insert before image_load_status
-            
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            # Add custom_project_dir to results if in extra mode
-            if self.extra_mode:
-                for result in results:
-                    if 'custom_project_dir' not in result:
-                        result['custom_project_dir'] = ''  # Default empty value
-            
-            writer.writerows(results)
-        
         logger.info(f"Results written to: {output_csv}")
         
         # Print summary
-        status_counts = {}
-        for result in results:
-            status = result['image_load_status']
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
         print("\nSummary:")
         for status, count in status_counts.items():
             print(f"  {status}: {count}")
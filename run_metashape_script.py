@@ -1,6 +1,10 @@
+import argparse
 import csv
-import subprocess
+import importlib.util
+import multiprocessing
+import shlex
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Path to the CSV file containing the arguments
 csv_file_path = r"M:\working_package_2\2024_dronecampaign\02_processing\metashape_projects\logbook_test_RGBandMulti_dataproject_created.csv"
@@ -8,42 +12,115 @@ csv_file_path = r"M:\working_package_2\2024_dronecampaign\02_processing\metashap
 # Path to the target Python script you want to call
 target_script_path = r"C:\Users\admin\Documents\Python Scripts\drone_metashape\metashape_proc_Upscale_copy.py"
 
-# Open the CSV and read rows
-with open(csv_file_path, mode='r', newline='', encoding='utf-8') as csv_file:
-    csv_reader = csv.DictReader(csv_file)
-    
-    for row in csv_reader:
-        cmd = [sys.executable, target_script_path]
-
-        # Append required arguments
-        if row['proj_path']:
-            cmd.extend(["-proj_path", row['project_path']])
-        if row['date']:
-            cmd.extend(["-date", row['date']])
-        if row['site']:
-            cmd.extend(["-site", row['site']])
-        if row['crs']:
-            cmd.extend(["-crs", "2056"])
-        
-        # Append optional arguments
-        if row['multispec']:
-            cmd.extend(["-multispec", row['multispec']])
-        if row['rgb']:
-            cmd.extend(["-rgb", row['rgb']])
-        if row['sunsens'] and row['sunsens'].lower() == 'true':
-            cmd.append("-sunsens")
-
-        # Check if all required arguments are present
-        required_args = ['proj_path', 'date', 'site', 'crs']
-        missing_args = [arg for arg in required_args if not row[arg]]
-        if missing_args:
-            print(f"Skipping row due to missing required arguments: {', '.join(missing_args)}")
-            continue
-
-        # Print the command for debugging purposes
-        print("Running command:", " ".join(cmd))
-
-        print("Running command:", " ".join(cmd))
-        
-        # Run the target script with the arguments
-        subprocess.run(cmd, check=True)
\ No newline at end of file
+# Number of projects processed at the same time by default (see -workers). Each one is a full Metashape run
+# that uses all GPUs unless -gpus is given, so more than one only makes sense with one GPU per worker.
+MAX_WORKERS = 1
+
+# Print the command of every row
+VERBOSE = False
+
+# CSV values counted as true for flag columns
+TRUTHY = {"true", "1", "yes"}
+
+# Target script module, loaded once per worker process by process_row
+_proc_module = None
+
+# GPU index of this worker process, set by init_worker when -gpus is given
+_worker_gpu = None
+
+
+def init_worker(free_gpus):
+    """Take one GPU index from free_gpus for the lifetime of this worker process"""
+    global _worker_gpu
+    if free_gpus is not None:
+        _worker_gpu = free_gpus.get()
+
+
+def process_row(cmd_args):
+    """
+    Run the target script in this worker process with the given command line arguments. The script (and
+    Metashape) is imported only on the first row a worker gets; later rows reuse it through run_project.
+    """
+    global _proc_module
+    if _proc_module is None:
+        spec = importlib.util.spec_from_file_location("metashape_proc_target", target_script_path)
+        _proc_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_proc_module)
+        if _worker_gpu is not None:
+            # run_project sets Metashape.app.gpu_mask from _GPU_MASK; restrict it to this worker's GPU
+            _proc_module._GPU_MASK = 1 << _worker_gpu
+    try:
+        _proc_module.run_project(_proc_module.parse_args(cmd_args))
+    except SystemExit as e:
+        # The target script exits on invalid input; report it as an error of this row only
+        raise RuntimeError(f"Target script exited: {e}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the target script for every row of the CSV file')
+    parser.add_argument('-workers', type=int, default=MAX_WORKERS,
+                        help=f'Number of projects processed at the same time. Default: {MAX_WORKERS}')
+    parser.add_argument('-gpus', type=int, default=0,
+                        help='Number of GPUs to spread the workers over, one GPU per worker. '
+                             'Default: 0 (each project uses all GPUs)')
+    args = parser.parse_args()
+
+    free_gpus = None
+    workers = max(1, args.workers)
+    if args.gpus > 0:
+        free_gpus = multiprocessing.Queue()
+        for gpu in range(args.gpus):
+            free_gpus.put(gpu)
+        workers = min(workers, args.gpus)
+
+    futures = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(free_gpus,)) as executor:
+        # Open the CSV and read rows
+        with open(csv_file_path, mode='r', newline='', encoding='utf-8') as csv_file:
+            csv_reader = csv.DictReader(csv_file)
+
+            for row in csv_reader:
+                cmd = []
+
+                # Append required arguments
+                if row['proj_path']:
+                    cmd.extend(["-proj_path", row['project_path']])
+                if row['date']:
+                    cmd.extend(["-date", row['date']])
+                if row['site']:
+                    cmd.extend(["-site", row['site']])
+                if row['crs']:
+                    cmd.extend(["-crs", "2056"])
+
+                # Append optional arguments
+                if row['multispec']:
+                    cmd.extend(["-multispec", row['multispec']])
+                if row['rgb']:
+                    cmd.extend(["-rgb", row['rgb']])
+                if (row.get('sunsens') or '').strip().lower() in TRUTHY:
+                    cmd.append("-sunsens")
+
+                # Check if all required arguments are present
+                required_args = ['proj_path', 'date', 'site', 'crs']
+                missing_args = [arg for arg in required_args if not row[arg]]
+                if missing_args:
+                    print(f"Skipping row due to missing required arguments: {', '.join(missing_args)}")
+                    continue
+
+                # Print the command for debugging purposes
+                if VERBOSE:
+                    print("Running command:", shlex.join([sys.executable, target_script_path] + cmd))
+
+                # Run the target script with the arguments in a worker process
+                futures[executor.submit(process_row, cmd)] = row['project_path']
+
+        for future in as_completed(futures):
+            try:
+                future.result()
+                print(f"Finished: {futures[future]}")
+            except Exception as e:
+                print(f"Error processing {futures[future]}: {e}")
+
+
+if __name__ == "__main__":
+    main()
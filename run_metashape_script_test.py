@@ -1,18 +1,25 @@
 import csv
+import shlex
 import subprocess
 import sys
 
-print("I am running")
 # Path to the CSV file containing the arguments
 csv_file_path = r"M:\working_package_2\2024_dronecampaign\01_data\dronetest\processing_test\arguments_log_test3.csv"
 
 # Path to the target Python script you want to call
 target_script_path = r"C:\Users\admin\Documents\Python Scripts\drone_metashape\metashape_proc_Upscale.py"
 
-print("hello")
+# Print each CSV row and the command run for it
+DEBUG = False
+
+# CSV values counted as true for flag columns
+TRUTHY = {"true", "1", "yes"}
+
+# Start of every command, built once
+BASE_CMD = [sys.executable, target_script_path]
+
 # Open the CSV and read rows
 with open(csv_file_path, mode='r', newline='', encoding='utf-8') as csv_file:
-    print("fyck")
     csv_reader = csv.DictReader(csv_file)
     for row in csv_reader:
         # Build the arguments for the target script
@@ -31,27 +38,23 @@ with open(csv_file_path, mode='r', newline='', encoding='utf-8') as csv_file:
         #   -multionly (flag)
         # You can add them as needed.
 
-        cmd = [sys.executable, target_script_path ]
+        cmd = list(BASE_CMD)
 
         # Now append additional arguments that your target script expects:
         # For each column in the CSV that your script uses as an argument, append them:
         
         # Example: If your script is expecting a '-date' argument:
-        print(row)  
-        cmd.extend(["-proj_path", row['proj_path']]) 
-        cmd.extend(["-date", row['date']])
-        cmd.extend(["-site", row['site']])
-        cmd.extend(["-crs", row['crs']])
-        cmd.extend(["-multispec", row['multispec']])
-        cmd.extend(["-rgb", row['rgb']])
-        cmd.extend(["-smooth", row['smooth']])
+        if DEBUG:
+            print(row)
+        cmd += ["-proj_path", row['proj_path'], "-date", row['date'], "-site", row['site'], "-crs", row['crs'],
+                "-multispec", row['multispec'], "-rgb", row['rgb'], "-smooth", row['smooth']]
         
         # If 'drtk' is optional, only add if not None
         if row['drtk'] and row['drtk'].lower() != "none":
             cmd.extend(["-drtk", row['drtk']])
 
         # If 'sunsens' is True/False, maybe your script expects a flag:
-        if row['sunsens'].lower() == "true":
+        if (row.get('sunsens') or '').strip().lower() in TRUTHY:
             cmd.append("-sunsens")
 
         # If your script expects a '-test' flag when True:
@@ -59,11 +62,12 @@ with open(csv_file_path, mode='r', newline='', encoding='utf-8') as csv_file:
         cmd.append("-test")
 
         # If your script expects a '-multionly' flag when True:
-        if row['multionly'].lower() == "true":
+        if (row.get('multionly') or '').strip().lower() in TRUTHY:
             cmd.append("-multionly")
 
         # Print the command for debugging purposes
-        print("Running command:", " ".join(cmd))
+        if DEBUG:
+            print("Running command:", shlex.join(cmd))
         
         # Run the target script with the arguments
         subprocess.run(cmd, check=True)
\ No newline at end of file
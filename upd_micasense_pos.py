@@ -21,12 +21,22 @@ This module is imported in other py scripts that process p1+micasense imagery.
 
 import os
 import glob
+import logging
 import numpy as np
 import exifread
 import datetime
+from pyproj import CRS
 from pyproj.transformer import TransformerGroup
 from datetime import datetime, timedelta
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 ###############################################################################
 # Variable declarations, constants
 ###############################################################################
@@ -43,6 +53,13 @@ LEAPSECS = 37
 GPSUTC_deltat = 0
 MICA_deltat = -18
 EPSG_4326 = 4326
+GPS_EPOCH = np.datetime64('1980-01-06T00:00:00', 'us')
+SECS_PER_WEEK = 7*24*60*60
+
+# Tab-separated MRK columns used: GPS seconds of week, [GPS week], "lat,Lat", "lon,Lon", "ellh,Ellh"
+MRK_COLUMNS = ['f1', 'f2', 'f6', 'f7', 'f8']
+
+logger = logging.getLogger(__name__)
 
 
 ###############################################################################
@@ -85,6 +102,35 @@ def _convert_to_degress(value):
     return d + (m / 60.0) + (s / 3600.0)
 
 
+def _read_mrk(MRK_file):
+    """
+    Return GPS seconds of week, GPS week, latitude, longitude and ellipsoidal height of all images in an
+    MRK file as numpy arrays. Uses the pyarrow CSV reader when available and falls back to splitting lines.
+    """
+    if PYARROW_AVAILABLE:
+        table = pa_csv.read_csv(
+            MRK_file,
+            read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+            parse_options=pa_csv.ParseOptions(delimiter='\t', quote_char=False),
+            convert_options=pa_csv.ConvertOptions(include_columns=MRK_COLUMNS,
+                                                  column_types={c: pa.string() for c in MRK_COLUMNS}))
+        secs = pc.cast(pc.utf8_trim_whitespace(table['f1']), pa.float64())
+        week = pc.cast(pc.utf8_trim(table['f2'], characters="[] "), pa.int64())
+        # "-33.12345678,Lat" -> -33.12345678
+        coords = [pc.cast(pc.utf8_trim_whitespace(pc.replace_substring_regex(table[c], pattern=",.*$", replacement="")),
+                          pa.float64()).to_numpy() for c in ('f6', 'f7', 'f8')]
+        return (secs.to_numpy(), week.to_numpy(), *coords)
+
+    with open(MRK_file, 'r') as mrk_in:
+        fields = [mrk.split() for mrk in mrk_in if mrk.strip()]
+    secs = np.array([float(m[1]) for m in fields])
+    week = np.array([int(m[2].strip("[").strip("]")) for m in fields])
+    lat = np.array([float(m[6].split(",")[0]) for m in fields])
+    lon = np.array([float(m[7].split(",")[0]) for m in fields])
+    ellh = np.array([float(m[8].split(",")[0]) for m in fields])
+    return secs, week, lat, lon, ellh
+
+
 def get_P1_position(MRK_file, file_count):
     """
     Inputs: MRK file name, file count (in case of more than one MRK file for same mission). 
@@ -100,30 +146,51 @@ def get_P1_position(MRK_file, file_count):
         
     print("Get P1 position")
 
-    with open(MRK_file, 'r') as mrk_in:
-        mrks = mrk_in.readlines()
+    secs, week, lat, lon, ellh = _read_mrk(MRK_file)
     
-    P1_first_timestamp[file_count] = get_P1_timestamp(mrks[0])
-    P1_last_timestamp[file_count] = get_P1_timestamp(mrks[-1])
+    # GPS week/seconds to camera timestamps for all images at once
+    epoch_secs = secs + week*SECS_PER_WEEK - GPSUTC_deltat
+    camera_timestamps = (GPS_EPOCH + np.round(epoch_secs*1e6).astype('timedelta64[us]')).tolist()
     
-    for mrk in mrks:
-        m = mrk.split()
-        
-        secs = float(m[1])
-        week = int(m[2].strip("[").strip("]"))
-        epoch_secs = secs + (week*7*24*60*60)
-        temp_timestamp = datetime(1980, 1, 6) + timedelta(seconds=epoch_secs)
-        camera_timestamp = temp_timestamp - timedelta(seconds=GPSUTC_deltat)
-        
-        lat = float(m[6].split(",")[0])
-        lon = float(m[7].split(",")[0])
-        ellh = float(m[8].split(",")[0])
-        
-        P1_events.append(camera_timestamp)
-        P1_pos_mrk.append([lat, lon, ellh])
+    P1_first_timestamp[file_count] = camera_timestamps[0].timestamp()
+    P1_last_timestamp[file_count] = camera_timestamps[-1].timestamp()
+    
+    P1_events.extend(camera_timestamps)
+    P1_pos_mrk.extend(np.column_stack((lat, lon, ellh)).tolist())
+
+    
+def get_transformer(epsg_crs, three_d=False):
+    """
+    Return the pyproj transformer from WGS84 Lat/Lon (EPSG: 4326) to the projected coordinate system epsg_crs.
+    Input and output axes are in authority order, i.e. (lat, lon) -> (E, N) for the usual projected CRSs.
+    With three_d=True both CRSs are promoted to 3D, so ellipsoidal heights go through the datum transformation
+    as well (lat, lon, h) -> (E, N, h), as in Metashape.CoordinateSystem.transform.
+    """
+    # Assumption that '-crs' input by user (TERN data across Australia only) is GDA2020 projected coordinate system.
+    # E.g. EPSG: 7855 for Tasmania
+
+    # Issue in pyproj/proj version available for py3.9/Metashape Pro 2.0.1 where a different transformation (to
+    # Metashape/previous Proj version) is chosen.
+    # Fix in later PROJ version has been to chose transformation with fewer steps - which in the case of GDA2020
+    # projected CS is the one chosen in Metashape as well.
+    # see https://github.com/OSGeo/PROJ/pull/3248
+    if three_d:
+        transf_group = TransformerGroup(CRS(EPSG_4326).to_3d(), CRS(int(epsg_crs)).to_3d())
+    else:
+        transf_group = TransformerGroup(EPSG_4326, int(epsg_crs))
+
+    # Specify pipeline to avoid issues with different transformers being chosen depending on PROJ version
+    # More info:https://github.com/pyproj4/pyproj/issues/989#issuecomment-974149918
+    step_count = []
+    for tr in transf_group.transformers:
+        step_count.append(str(tr).count("step")) # count 'steps' in each pipeline
+
+    # Revisit below fix to use transformer with fewer steps in case of any future updates to Metashape/PyProj/PROJ
+    min_step_idx = step_count.index(min(step_count))
+    return transf_group.transformers[min_step_idx]
 
     
-def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_file, P1_shift_vec):
+def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_file, P1_shift_vec, verbose=False):
     """
     Parameters
     ----------
@@ -145,6 +212,8 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
         Path and name of output CSV file with udpated Easting/Norhting/Altitude for all MicaSense images
     P1_shift_vec : vector
         Vector to be used to blockshift P1 positions. 
+    verbose : bool
+        If True, log progress of the MicaSense EXIF scan.
 
     Returns
     -------
@@ -158,25 +227,7 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
     mica_count = 0
     
     # Used to convert P1 positions from WGS84 Lat/Lon (EPSG: 4326) to projected coordinate system
-    # Assumption that '-crs' input by user (TERN data across Australia only) is GDA2020 projected coordinate system.
-    # E.g. EPSG: 7855 for Tasmania
-
-    # Issue in pyproj/proj version available for py3.9/Metashape Pro 2.0.1 where a different transformation (to
-    # Metashape/previous Proj version) is chosen.
-    # Fix in later PROJ version has been to chose transformation with fewer steps - which in the case of GDA2020
-    # projected CS is the one chosen in Metashape as well.
-    # see https://github.com/OSGeo/PROJ/pull/3248
-    transf_group = TransformerGroup(EPSG_4326, int(epsg_crs))
-
-    # Specify pipeline to avoid issues with different transformers being chosen depending on PROJ version
-    # More info:https://github.com/pyproj4/pyproj/issues/989#issuecomment-974149918
-    step_count = []
-    for tr in transf_group.transformers:
-        step_count.append(str(tr).count("step")) # count 'steps' in each pipeline
-
-    # Revisit below fix to use transformer with fewer steps in case of any future updates to Metashape/PyProj/PROJ
-    min_step_idx = step_count.index(min(step_count))
-    transformer = transf_group.transformers[min_step_idx]
+    transformer = get_transformer(epsg_crs)
 
     # List of MicaSense master band images
     os.chdir(micasense_folder)
@@ -241,9 +292,9 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
         E, N = transformer.transform(lat_value, lon_value)
         mica_pos.append([E, N, alt_value])
         
-        # Just a print to show progress
-        if mica_count % 100 == 0:
-            print(mica_count)
+        # Progress is only logged in verbose mode to keep stdout out of the loop
+        if verbose and mica_count % 100 == 0:
+            logger.info("progress %d", mica_count)
         mica_count = mica_count + 1
         f.close()
     
@@ -266,21 +317,37 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
     P1_pos_arr = np.array(P1_pos_mrk)
     P1_pos_shifted = P1_pos_arr + P1_shift_vec         
     
-    # Convert to target projected CRS prior to interpolating position
-    E, N = transformer.transform(P1_pos_shifted[:,0], P1_pos_shifted[:,1])
-    P1_pos = np.dstack((E, N, P1_pos_shifted[:,2]))[0]    
+    # Convert to target projected CRS prior to interpolating position.
+    # Contiguous float64 columns let pyproj transform in place without copying, and filling
+    # a preallocated array avoids the temporaries created by np.dstack.
+    E = np.ascontiguousarray(P1_pos_shifted[:,0], dtype=np.float64)
+    N = np.ascontiguousarray(P1_pos_shifted[:,1], dtype=np.float64)
+    transformer.transform(E, N, radians=False, inplace=True)
+    P1_pos = np.empty((P1_pos_shifted.shape[0], 3), dtype=np.float64)
+    P1_pos[:,0] = E
+    P1_pos[:,1] = N
+    P1_pos[:,2] = P1_pos_shifted[:,2]
         
-    # Create output MicaSense position csv 
-    out_frame = open(out_file, 'w')
-    # write header row
-    rec = ("Label, Easting, Northing, Ellip Height\n")
-    out_frame.write(rec) 
+    # Output rows are collected in memory and written to the CSV in one go after the loop
+    rows = [None] * len(mica_events)
     
     count = 0
     
     first_P1_timestamp = P1_first_timestamp[1]
     last_P1_timestamp = P1_last_timestamp[mrk_file_count]
 
+    # When more than one flight for same mission, flag MicaSense images that triggered between flights.
+    # Gaps run from the last P1 timestamp of one flight to the first of the next; flights are in
+    # chronological order so the gap starts are sorted and each image needs a single binary search.
+    gap_starts = np.array([P1_last_timestamp[i] for i in range(1, mrk_file_count)], dtype=np.float64)
+    gap_ends = np.array([P1_first_timestamp[i+1] for i in range(1, mrk_file_count)], dtype=np.float64)
+    mica_ts = np.array([t.timestamp() for t in mica_events], dtype=np.float64)
+    if gap_starts.size:
+        gap_idx = np.searchsorted(gap_starts, mica_ts, side='left') - 1
+        in_gap = (gap_idx >= 0) & (mica_ts < gap_ends[np.maximum(gap_idx, 0)])
+    else:
+        in_gap = np.zeros(mica_ts.shape, dtype=bool)
+
     for m_cam_time in mica_events:
         P1_triggered = True 
         a = find_nearest(P1_events, m_cam_time)
@@ -297,15 +364,12 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
             P1_triggered = False
             
         # When more than one flight for same mission, also ignore MicaSense images that triggered between flights    
-        elif(mrk_file_count > 1):
-            for mrk_loop in range(1, mrk_file_count):
-                if ((camera_time_sec > P1_last_timestamp[mrk_loop] and 
-                     camera_time_sec < P1_first_timestamp[mrk_loop+1])):
-                    time1 = 0
-                    time2 = 0
-                    upd_pos1 = [0, 0, 0]
-                    upd_pos2 = [0, 0, 0]
-                    P1_triggered = False
+        elif in_gap[count]:
+            time1 = 0
+            time2 = 0
+            upd_pos1 = [0, 0, 0]
+            upd_pos2 = [0, 0, 0]
+            P1_triggered = False
                     
         # Update MicaSense position for images that triggered within P1 times.           
         if P1_triggered:    
@@ -352,16 +416,17 @@ def ret_micasense_pos(mrk_folder, micasense_folder, image_suffix, epsg_crs, out_
 
         # For images captured within P1 times, write updated Easting, Northing, Ellipsoidal height to CSV
         if(upd_micasense_pos[2] != 0):
-                        rec = ("%s, %10.4f, %10.4f, %10.4f\n" % \
-                                (image_name, upd_micasense_pos[0], upd_micasense_pos[1], upd_micasense_pos[2]))
+                        rec = f"{image_name}, {upd_micasense_pos[0]:10.4f}, {upd_micasense_pos[1]:10.4f}, {upd_micasense_pos[2]:10.4f}\n"
         else:
                         # For MicaSense images captured outisde P1 times, just save original Easting, Northing. BUT set ellipsoidal height to 0 
                         # to filter and delete these cameras
-                        rec = ("%s, %10.4f, %10.4f, %10.4f\n" % \
-                                (image_name, mica_pos[pos_index][0], mica_pos[pos_index][1], upd_micasense_pos[2]))
+                        rec = f"{image_name}, {mica_pos[pos_index][0]:10.4f}, {mica_pos[pos_index][1]:10.4f}, {upd_micasense_pos[2]:10.4f}\n"
                         
-        out_frame.write(rec) 
+        rows[count] = rec
         count = count + 1
         
-    # Close the CSV file
-    out_frame.close()
\ No newline at end of file
+    # Create output MicaSense position csv with a large write buffer
+    with open(out_file, 'w', buffering=1 << 20) as out_frame:
+        # write header row
+        out_frame.write("Label, Easting, Northing, Ellip Height\n")
+        out_frame.writelines(rows)
\ No newline at end of file